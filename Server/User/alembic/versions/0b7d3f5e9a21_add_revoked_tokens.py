@@ -0,0 +1,39 @@
+"""add_revoked_tokens
+
+Revision ID: 0b7d3f5e9a21
+Revises: f2a9d81c3e47
+Create Date: 2025-07-17 10:12:04.318276
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7d3f5e9a21'
+down_revision: Union[str, Sequence[str], None] = 'f2a9d81c3e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('revoked_tokens',
+    sa.Column('jti', sa.String(length=36), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('expires_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('revoked_at', sa.TIMESTAMP(), server_default=sa.text("timezone('utc', now())"), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('jti')
+    )
+    op.create_index(op.f('ix_revoked_tokens_expires_at'), 'revoked_tokens', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_revoked_tokens_revoked_at'), 'revoked_tokens', ['revoked_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_revoked_tokens_revoked_at'), table_name='revoked_tokens')
+    op.drop_index(op.f('ix_revoked_tokens_expires_at'), table_name='revoked_tokens')
+    op.drop_table('revoked_tokens')
@@ -0,0 +1,49 @@
+"""add_search_history
+
+Revision ID: 3c9e7a1d5b42
+Revises: 0b7d3f5e9a21
+Create Date: 2025-07-17 16:40:22.905113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e7a1d5b42'
+down_revision: Union[str, Sequence[str], None] = '0b7d3f5e9a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('search_history',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('query_text', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text("timezone('utc', now())"), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_search_history_user_created', 'search_history', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_search_history_created_at_brin', 'search_history', ['created_at'], unique=False, postgresql_using='brin')
+
+    # Rows saved without a timestamp sort as the oldest history
+    op.execute("UPDATE voice_queries SET created_at = 'epoch' WHERE created_at IS NULL")
+    op.alter_column('voice_queries', 'created_at', existing_type=sa.TIMESTAMP(), nullable=False,
+                    server_default=sa.text("timezone('utc', now())"))
+    op.create_index('ix_voice_queries_user_created', 'voice_queries', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_voice_queries_created_at_brin', 'voice_queries', ['created_at'], unique=False, postgresql_using='brin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_voice_queries_created_at_brin', table_name='voice_queries', postgresql_using='brin')
+    op.drop_index('ix_voice_queries_user_created', table_name='voice_queries')
+    op.alter_column('voice_queries', 'created_at', existing_type=sa.TIMESTAMP(), nullable=True, server_default=None)
+    op.drop_index('ix_search_history_created_at_brin', table_name='search_history', postgresql_using='brin')
+    op.drop_index('ix_search_history_user_created', table_name='search_history')
+    op.drop_table('search_history')
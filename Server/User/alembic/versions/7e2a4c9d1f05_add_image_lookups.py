@@ -0,0 +1,33 @@
+"""add_image_lookups
+
+Revision ID: 7e2a4c9d1f05
+Revises: 3c9e7a1d5b42
+Create Date: 2025-07-18 10:12:47.381520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e2a4c9d1f05'
+down_revision: Union[str, Sequence[str], None] = '3c9e7a1d5b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('image_lookups',
+    sa.Column('query_key', sa.String(length=100), nullable=False),
+    sa.Column('image_url', sa.Text(), nullable=True),
+    sa.Column('looked_up_at', sa.TIMESTAMP(), server_default=sa.text("timezone('utc', now())"), nullable=False),
+    sa.PrimaryKeyConstraint('query_key')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('image_lookups')
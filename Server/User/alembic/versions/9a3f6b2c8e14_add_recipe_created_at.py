@@ -0,0 +1,30 @@
+"""add_recipe_created_at
+
+Revision ID: 9a3f6b2c8e14
+Revises: 7e2a4c9d1f05
+Create Date: 2025-07-19 09:41:05.662318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a3f6b2c8e14'
+down_revision: Union[str, Sequence[str], None] = '7e2a4c9d1f05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('recipes', sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text("timezone('utc', now())"), nullable=False))
+    op.create_index(op.f('ix_recipes_created_at'), 'recipes', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_recipes_created_at'), table_name='recipes')
+    op.drop_column('recipes', 'created_at')
@@ -0,0 +1,56 @@
+"""add_recipe_title_key
+
+Revision ID: a1c9e4f27b10
+Revises: 3e4ca92dc335
+Create Date: 2025-07-12 10:04:31.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c9e4f27b10'
+down_revision: Union[str, Sequence[str], None] = '3e4ca92dc335'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('recipes', sa.Column('title_key', sa.String(length=100), nullable=True))
+
+    # Same normalization as crud.normalize_title
+    op.execute(
+        "UPDATE recipes SET title_key = btrim(regexp_replace(lower(title), '[^[:alnum:]]+', ' ', 'g'))"
+    )
+
+    # Existing AI-generated duplicates keep their data but drop out of the
+    # cache lookup; the most complete row for each key wins.
+    op.execute("""
+        UPDATE recipes SET title_key = NULL
+        FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY title_key
+                ORDER BY (ingredients = '' OR steps = ''), id
+            ) AS rn
+            FROM recipes
+            WHERE created_by IS NULL AND title_key IS NOT NULL
+        ) dup
+        WHERE recipes.id = dup.id AND dup.rn > 1
+    """)
+
+    op.create_index('ix_recipes_title_key', 'recipes', ['title_key'])
+    op.create_index(
+        'uq_recipes_ai_title_key', 'recipes', ['title_key'],
+        unique=True, postgresql_where=sa.text('created_by IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_recipes_ai_title_key', table_name='recipes')
+    op.drop_index('ix_recipes_title_key', table_name='recipes')
+    op.drop_column('recipes', 'title_key')
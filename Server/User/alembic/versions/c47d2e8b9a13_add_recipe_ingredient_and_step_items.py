@@ -0,0 +1,39 @@
+"""add_recipe_ingredient_and_step_items
+
+Revision ID: c47d2e8b9a13
+Revises: a1c9e4f27b10
+Create Date: 2025-07-13 09:12:45.301877
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c47d2e8b9a13'
+down_revision: Union[str, Sequence[str], None] = 'a1c9e4f27b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Existing rows are left NULL; fill them with backfill_recipe_items.py.
+    """
+    op.add_column('recipes', sa.Column('ingredient_items', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('recipes', sa.Column('step_items', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.create_index(
+        'ix_recipes_ingredient_items', 'recipes', ['ingredient_items'],
+        postgresql_using='gin', postgresql_ops={'ingredient_items': 'jsonb_path_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recipes_ingredient_items', table_name='recipes')
+    op.drop_column('recipes', 'step_items')
+    op.drop_column('recipes', 'ingredient_items')
@@ -0,0 +1,31 @@
+"""add_recipe_pagination_indexes
+
+Revision ID: d5e1f3a07c62
+Revises: c47d2e8b9a13
+Create Date: 2025-07-14 16:40:02.774310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5e1f3a07c62'
+down_revision: Union[str, Sequence[str], None] = 'c47d2e8b9a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keyset pagination sorts on (column, id)
+    op.create_index('ix_recipes_title_id', 'recipes', ['title', 'id'])
+    op.create_index('ix_recipes_estimated_time_id', 'recipes', ['estimated_time', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recipes_estimated_time_id', table_name='recipes')
+    op.drop_index('ix_recipes_title_id', table_name='recipes')
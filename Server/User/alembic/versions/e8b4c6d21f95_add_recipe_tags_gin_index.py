@@ -0,0 +1,29 @@
+"""add_recipe_tags_gin_index
+
+Revision ID: e8b4c6d21f95
+Revises: d5e1f3a07c62
+Create Date: 2025-07-15 11:27:18.093416
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b4c6d21f95'
+down_revision: Union[str, Sequence[str], None] = 'd5e1f3a07c62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Default jsonb_ops (not jsonb_path_ops) so the ?| operator can use it
+    op.create_index('ix_recipes_tags', 'recipes', ['tags'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recipes_tags', table_name='recipes')
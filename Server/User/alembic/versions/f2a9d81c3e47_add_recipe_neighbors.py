@@ -0,0 +1,40 @@
+"""add_recipe_neighbors
+
+Revision ID: f2a9d81c3e47
+Revises: e8b4c6d21f95
+Create Date: 2025-07-16 14:53:39.662105
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a9d81c3e47'
+down_revision: Union[str, Sequence[str], None] = 'e8b4c6d21f95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('recipe_neighbors',
+    sa.Column('recipe_id', sa.UUID(), nullable=False),
+    sa.Column('neighbor_id', sa.UUID(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['neighbor_id'], ['recipes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('recipe_id', 'neighbor_id')
+    )
+    # The personalized feed looks up a user's likes and favorites
+    op.create_index('ix_user_recipe_interaction_user_id', 'user_recipe_interaction', ['user_id'])
+    op.create_index('ix_favorites_user_id', 'favorites', ['user_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_favorites_user_id', table_name='favorites')
+    op.drop_index('ix_user_recipe_interaction_user_id', table_name='user_recipe_interaction')
+    op.drop_table('recipe_neighbors')
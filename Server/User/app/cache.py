@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "ai_cache.sqlite3")
+AI_CACHE_MEMORY_ENTRIES = int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "1000"))
+AI_CACHE_DISK_ENTRIES = int(os.getenv("AI_CACHE_DISK_ENTRIES", "50000"))
+# Expired responses are kept this long to answer with while Gemini is down.
+AI_CACHE_STALE_SECONDS = float(os.getenv("AI_CACHE_STALE_SECONDS", "604800"))
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize: int = 1000, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Persistent key/value tier backed by a local SQLite file.
+
+    Entries expire after their TTL but stay readable with ``allow_stale``
+    for ``stale_seconds`` more. Once the table grows past ``max_entries``,
+    the least recently used rows are evicted.
+    """
+
+    _EVICT_EVERY = 100
+
+    def __init__(self, path: str, max_entries: int = 50000, stale_seconds: float = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_last_access ON cache (last_access)")
+
+    def get(self, key: str, allow_stale: bool = False):
+        """Return ``(value, expires_at)`` for a live (or, with ``allow_stale``, recently expired) entry, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now - self.stale_seconds:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            if row[1] <= now and not allow_stale:
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            return row
+
+    def set(self, key: str, value: str, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % self._EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now - self.stale_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split()).casefold()
+
+
+class PromptCache:
+    """Two-tier cache for Gemini responses keyed on the normalized prompt and model URL."""
+
+    def __init__(self, path: str, memory_entries: int, disk_entries: int, stale_seconds: float = 0):
+        self.memory = LRUCache(maxsize=memory_entries)
+        self.disk = SQLiteCache(path, max_entries=disk_entries, stale_seconds=stale_seconds)
+        self.disk_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(prompt: str, model_url: str) -> str:
+        raw = f"{model_url or ''}\n{normalize_prompt(prompt)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        row = await asyncio.to_thread(self.disk.get, key)
+        if row is None:
+            self.misses += 1
+            return None
+        value, expires_at = row
+        self.disk_hits += 1
+        # Promote to memory for the remainder of the entry's lifetime.
+        self.memory.set(key, value, ttl=max(expires_at - time.time(), 0))
+        return value
+
+    async def get_stale(self, key: str) -> Optional[str]:
+        """A cached response even if expired (within the stale window), for when Gemini can't be reached."""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        row = await asyncio.to_thread(self.disk.get, key, True)
+        if row is None:
+            return None
+        self.stale_hits += 1
+        return row[0]
+
+    async def set(self, key: str, value: str, ttl: float):
+        self.memory.set(key, value, ttl=ttl)
+        await asyncio.to_thread(self.disk.set, key, value, ttl)
+
+    def stats(self) -> dict:
+        lookups = self.memory.hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+            "memory_evictions": self.memory.evictions,
+            "hit_ratio": (self.memory.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        self.disk.close()
+
+
+_prompt_cache: Optional[PromptCache] = None
+
+
+def get_prompt_cache() -> PromptCache:
+    global _prompt_cache
+    if _prompt_cache is None:
+        _prompt_cache = PromptCache(AI_CACHE_PATH, AI_CACHE_MEMORY_ENTRIES, AI_CACHE_DISK_ENTRIES, AI_CACHE_STALE_SECONDS)
+    return _prompt_cache
+
+
+def close_prompt_cache():
+    global _prompt_cache
+    if _prompt_cache is not None:
+        _prompt_cache.close()
+        _prompt_cache = None
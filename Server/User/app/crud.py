@@ -1,20 +1,63 @@
-from sqlalchemy.orm import Session
-from . import models, schemas
-from passlib.context import CryptContext
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from . import models, schemas, gemini, cache, resilience, ratelimit, recipe_parser, pantry_index, pagination, similarity, passwords, write_behind, images
+from .singleflight import SingleFlight
+from .user_cache import user_cache
 from uuid import UUID
+from typing import AsyncIterator, Optional
+from datetime import datetime, timedelta
+import heapq
+import logging
 import os
-import requests
+import re
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+# Identical uncached prompts that arrive together share one Gemini call.
+gemini_flights = SingleFlight()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+RECOMMENDATIONS_CACHE_TTL = float(os.getenv("RECOMMENDATIONS_CACHE_TTL", "300"))
+# Recommendations are computed (and cached) this deep; requests take a prefix.
+MAX_RECOMMENDATIONS = 50
+# Most recent likes/favorites used as seeds for the personalized feed.
+FEED_MAX_SEEDS = 200
+recommendation_cache = cache.LRUCache(maxsize=10000, ttl=RECOMMENDATIONS_CACHE_TTL)
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+# Voice and search history older than this is deleted (0 keeps everything).
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "180"))
+# Each user's most recent search (normalized), to skip saving the same search twice in a row.
+last_searches = cache.LRUCache(maxsize=10000)
+
+_TITLE_KEY_SEPARATORS = re.compile(r"[\W_]+")
+
+def normalize_title(title: str) -> str:
+    """Lowercase a recipe title and collapse punctuation and whitespace runs into single spaces.
+
+    Must stay in sync with the SQL backfill in the add_recipe_title_key migration.
+    """
+    return _TITLE_KEY_SEPARATORS.sub(" ", title.lower()).strip()
+
+def _split_lines(text: str) -> list:
+    return [line.strip() for line in (text or '').split('\n') if line.strip()]
+
+def ingredient_items(ingredients: list) -> list:
+    return [recipe_parser.parse_ingredient(line) for line in ingredients]
+
+def recipe_ingredients(recipe: models.Recipe) -> list:
+    """Ingredient lines of a recipe, from the structured column when it has been filled."""
+    if recipe.ingredient_items is not None:
+        return [item["text"] for item in recipe.ingredient_items]
+    return _split_lines(recipe.ingredients)
+
+def recipe_steps(recipe: models.Recipe) -> list:
+    if recipe.step_items is not None:
+        return recipe.step_items
+    return _split_lines(recipe.steps)
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate, hashed_password: str):
+    """Insert a user; hash the password first with ``await passwords.hash_password``."""
     db_user = models.User(
         first_name=user.first_name,
         last_name=user.last_name,
@@ -25,112 +68,310 @@ def create_user(db: Session, user: schemas.UserCreate):
         preferences=user.preferences or []
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(models.User).filter(models.User.email == email).first()
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    """Check credentials, upgrading the stored hash if BCRYPT_ROUNDS changed."""
+    user = await get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.password):
+    valid, new_hash = await passwords.verify_password(password, user.password)
+    if not valid:
         return None
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
     return user
 
-def get_user_by_id(db: Session, user_id: UUID):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_id(db: AsyncSession, user_id: UUID):
+    return await db.get(models.User, user_id)
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.User).where(models.User.email == email))
 
-def fetch_openverse_image(query: str) -> str:
-    """Fetch image from Openverse API (free alternative to Unsplash)"""
-    # First try with commercial license filter
-    url = f"https://api.openverse.engineering/v1/images/?q={query}&page_size=1&filter=license_type:commercial"
-    try:
-        resp = requests.get(url, timeout=10)
-        data = resp.json()
-        if data.get("results") and len(data["results"]) > 0:
-            return data["results"][0]["url"]
-    except Exception as e:
-        print(f"[Openverse] Error fetching commercial image for '{query}': {e}")
-    
-    # Fallback: try without commercial filter
-    try:
-        fallback_url = f"https://api.openverse.engineering/v1/images/?q={query}&page_size=1"
-        resp = requests.get(fallback_url, timeout=10)
-        data = resp.json()
-        if data.get("results") and len(data["results"]) > 0:
-            return data["results"][0]["url"]
-    except Exception as e:
-        print(f"[Openverse] Error fetching fallback image for '{query}': {e}")
-    
-    return None
-
-def create_recipe(db: Session, recipe: schemas.RecipeCreate, user_id: UUID):
-    image_url = recipe.image_url
-    if not image_url:
-        image_url = fetch_openverse_image(recipe.title)
+async def create_recipe(db: AsyncSession, recipe: schemas.RecipeCreate, user_id: UUID):
     db_recipe = models.Recipe(
         title=recipe.title,
-        image_url=image_url,
+        title_key=normalize_title(recipe.title),
+        image_url=recipe.image_url or None,
         ingredients=recipe.ingredients,
         steps=recipe.steps,
+        ingredient_items=ingredient_items(_split_lines(recipe.ingredients)),
+        step_items=_split_lines(recipe.steps),
         tags=recipe.tags or [],
         difficulty=recipe.difficulty,
         estimated_time=recipe.estimated_time,
         created_by=user_id
     )
     db.add(db_recipe)
-    db.commit()
-    db.refresh(db_recipe)
+    await db.commit()
+    await db.refresh(db_recipe)
+    pantry_index.index.add(db_recipe)
+    if not db_recipe.image_url:
+        # Filled in by the image workers; the response goes out without one.
+        images.enqueue(db_recipe.id, db_recipe.title, db_recipe.title_key)
     return db_recipe
 
-def get_recipe(db: Session, recipe_id: UUID):
-    return db.query(models.Recipe).filter(models.Recipe.id == recipe_id).first()
+async def get_recipe(db: AsyncSession, recipe_id: UUID):
+    return await db.get(models.Recipe, recipe_id)
+
+async def get_recipes_by_ids(db: AsyncSession, recipe_ids: list):
+    """Fetch recipes by id, returned in the order of ``recipe_ids``."""
+    if not recipe_ids:
+        return []
+    recipes = await db.scalars(select(models.Recipe).where(models.Recipe.id.in_(recipe_ids)))
+    by_id = {recipe.id: recipe for recipe in recipes}
+    return [by_id[recipe_id] for recipe_id in recipe_ids if recipe_id in by_id]
 
-def get_recipes(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Recipe).offset(skip).limit(limit).all()
+async def get_recipes(db: AsyncSession, skip: int = 0, limit: int = 10):
+    return (await db.scalars(select(models.Recipe).order_by(models.Recipe.id).offset(skip).limit(limit))).all()
 
-def get_recommendations(db: Session, user_id: UUID, limit: int = 10):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    preferences = user.preferences or []
-    return (
-        db.query(models.Recipe)
-        .filter(models.Recipe.tags.overlap(preferences))
-        .limit(limit)
-        .all()
+async def get_recipe_by_title(db: AsyncSession, title: str):
+    return await db.scalar(select(models.Recipe).where(models.Recipe.title_key == normalize_title(title)).limit(1))
+
+async def get_cached_recipes(db: AsyncSession, titles: list) -> dict:
+    """Stored recipes with ingredients and steps for any of ``titles``, keyed by normalized title."""
+    keys = {normalize_title(title) for title in titles}
+    rows = await db.scalars(
+        select(models.Recipe)
+        .where(models.Recipe.title_key.in_(keys), models.Recipe.ingredients != '', models.Recipe.steps != '')
     )
+    recipes = {}
+    for recipe in rows:
+        recipes.setdefault(recipe.title_key, recipe)
+    return recipes
 
-def call_gemini_api(prompt: str) -> str:
-    api_key = os.getenv("GEMINI_API_KEY")
-    api_url = os.getenv("GEMINI_API_URL")
-    print(f"[Gemini] api_key: {api_key}")
-    print(f"[Gemini] api_url: {api_url}")
-    print(f"[Gemini] prompt: {prompt!r}")
-    if not api_key or not api_url:
-        print("[Gemini] Missing API key or URL!")
-        return None
-    headers = {
-        "Content-Type": "application/json"
-    }
-    url = f"{api_url}?key={api_key}"
-    data = {
-        "contents": [{"parts": [{"text": prompt}]}]
-    }
+async def save_ai_recipe(db: AsyncSession, title: str, ingredients: list, steps: list, reference: str):
+    """Cache a Gemini-generated recipe so later requests for the same dish skip the AI call.
+
+    If another worker already cached the same dish, its row is kept and returned instead.
+    """
+    return (await save_ai_recipes(db, [(title, ingredients, steps, reference)]))[0]
+
+async def save_ai_recipes(db: AsyncSession, recipes: list) -> list:
+    """Cache several Gemini-generated recipes, given as (title, ingredients, steps, reference), in one transaction.
+
+    Returns the stored rows in input order; titles another worker already cached keep their row.
+    """
+    stmt = pg_insert(models.Recipe).values([
+        dict(
+            title=title,
+            title_key=normalize_title(title),
+            ingredients='\n'.join(ingredients),
+            steps='\n'.join(steps),
+            ingredient_items=ingredient_items(ingredients),
+            step_items=steps,
+            reference=reference,
+            image_url=None,
+            tags=[],
+            difficulty=None,
+            estimated_time=None,
+            created_by=None
+        )
+        for title, ingredients, steps, reference in recipes
+    ]).on_conflict_do_nothing(
+        index_elements=[models.Recipe.title_key],
+        index_where=models.Recipe.created_by.is_(None)
+    )
+    await db.execute(stmt)
+    await db.commit()
+    keys = [normalize_title(title) for title, _, _, _ in recipes]
+    stored = await db.scalars(
+        select(models.Recipe)
+        .where(models.Recipe.title_key.in_(keys), models.Recipe.created_by.is_(None))
+    )
+    by_key = {recipe.title_key: recipe for recipe in stored}
+    for recipe in by_key.values():
+        pantry_index.index.add(recipe)
+        if not recipe.image_url:
+            images.enqueue(recipe.id, recipe.title, recipe.title_key)
+    return [by_key[key] for key in keys]
+
+RECIPE_SORT_COLUMNS = {
+    "id": (None, None),
+    "title": (models.Recipe.title, str),
+    "estimated_time": (models.Recipe.estimated_time, int),
+}
+
+async def get_recipes_page(db: AsyncSession, limit: int = 10, cursor: Optional[str] = None, sort: str = "id"):
+    """Keyset pagination over recipes ordered by (sort column, id), NULLs last.
+
+    Returns ``(recipes, next_cursor)``; ``next_cursor`` is None on the last page.
+    Raises ValueError for an unknown sort or a cursor that doesn't belong to it.
+    """
+    if sort not in RECIPE_SORT_COLUMNS:
+        raise ValueError(f"Unknown sort '{sort}'")
+    column, value_type = RECIPE_SORT_COLUMNS[sort]
+    last_value = last_id = None
+    if cursor:
+        cursor_sort, last_value, last_id = pagination.decode_cursor(cursor)
+        # The id sort carries no value; bool is excluded because it passes isinstance(..., int).
+        if cursor_sort != sort or (last_value is not None and (
+                value_type is None or isinstance(last_value, bool) or not isinstance(last_value, value_type))):
+            raise ValueError("Cursor does not match the requested sort")
+        if not isinstance(last_id, str):
+            raise ValueError("Invalid cursor")
+        last_id = UUID(last_id)
+
+    query = select(models.Recipe)
+    if column is None:
+        if last_id is not None:
+            query = query.where(models.Recipe.id > last_id)
+        recipes = (await db.scalars(query.order_by(models.Recipe.id).limit(limit + 1))).all()
+    else:
+        # Two index range scans instead of one OR: non-NULL values in (column, id)
+        # order first, then the NULL rows by id once those run out.
+        recipes = []
+        if last_id is None or last_value is not None:
+            non_null = query.where(column.isnot(None))
+            if last_id is not None:
+                non_null = non_null.where(tuple_(column, models.Recipe.id) > tuple_(last_value, last_id))
+            recipes = list(await db.scalars(non_null.order_by(column, models.Recipe.id).limit(limit + 1)))
+        if len(recipes) <= limit:
+            nulls = query.where(column.is_(None))
+            if last_id is not None and last_value is None:
+                nulls = nulls.where(models.Recipe.id > last_id)
+            recipes += await db.scalars(nulls.order_by(models.Recipe.id).limit(limit + 1 - len(recipes)))
+
+    next_cursor = None
+    if len(recipes) > limit:
+        recipes = recipes[:limit]
+        last = recipes[-1]
+        next_cursor = pagination.encode_cursor([
+            sort, None if column is None else getattr(last, sort), str(last.id)
+        ])
+    return recipes, next_cursor
+
+async def get_recommendations(db: AsyncSession, user: models.User, limit: int = 10) -> list:
+    """Recipes whose tags overlap the user's preferences, most shared tags first.
+
+    Results are cached per user for RECOMMENDATIONS_CACHE_TTL seconds and
+    dropped as soon as update_user changes the user's preferences.
+    """
+    cached = recommendation_cache.get(user.id)
+    if cached is not None:
+        return cached[:limit]
+    preferences = list(dict.fromkeys(p for pref in (user.preferences or []) for p in (pref, pref.lower())))
+    if not preferences:
+        return []
+    # tags ?| preferences is answered from the GIN index on tags
+    tag = func.jsonb_array_elements_text(models.Recipe.tags).table_valued("value").alias("tag")
+    shared_tags = select(func.count()).select_from(tag).where(tag.c.value.in_(preferences)).scalar_subquery()
+    recipes = await db.scalars(
+        select(models.Recipe)
+        .where(models.Recipe.tags.has_any(array(preferences)))
+        .order_by(shared_tags.desc(), models.Recipe.id)
+        .limit(MAX_RECOMMENDATIONS)
+    )
+    result = [schemas.RecipeOut.model_validate(recipe, from_attributes=True).model_dump() for recipe in recipes]
+    recommendation_cache.set(user.id, result)
+    return result[:limit]
+
+async def get_personalized_feed(db: AsyncSession, user: models.User, limit: int = 20) -> list:
+    """Recipes similar to the ones the user liked or favorited, from the precomputed recipe_neighbors.
+
+    Falls back to tag-based recommendations for users without any likes or favorites yet.
+    """
+    seeds = {}
+    liked = await db.scalars(
+        select(models.UserRecipeInteraction.recipe_id)
+        .where(models.UserRecipeInteraction.user_id == user.id, models.UserRecipeInteraction.liked.is_(True))
+        .order_by(models.UserRecipeInteraction.viewed_at.desc().nulls_last())
+        .limit(FEED_MAX_SEEDS)
+    )
+    for recipe_id in liked:
+        seeds[recipe_id] = seeds.get(recipe_id, 0.0) + similarity.LIKE_WEIGHT
+    favorites = await db.scalars(
+        select(models.Favorite.recipe_id)
+        .where(models.Favorite.user_id == user.id)
+        .order_by(models.Favorite.added_at.desc().nulls_last())
+        .limit(FEED_MAX_SEEDS)
+    )
+    for recipe_id in favorites:
+        seeds[recipe_id] = seeds.get(recipe_id, 0.0) + similarity.FAVORITE_WEIGHT
+    seeds.pop(None, None)
+
+    scores = {}
+    if seeds:
+        neighbors = await db.execute(
+            select(models.RecipeNeighbor.recipe_id, models.RecipeNeighbor.neighbor_id, models.RecipeNeighbor.score)
+            .where(models.RecipeNeighbor.recipe_id.in_(list(seeds)))
+        )
+        for recipe_id, neighbor_id, score in neighbors:
+            if neighbor_id not in seeds:
+                scores[neighbor_id] = scores.get(neighbor_id, 0.0) + seeds[recipe_id] * score
+    if not scores:
+        return await get_recommendations(db, user, limit=min(limit, MAX_RECOMMENDATIONS))
+    top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+    return await get_recipes_by_ids(db, [recipe_id for recipe_id, _ in top])
+
+async def call_gemini_api(prompt: str, cache_ttl: Optional[float] = None) -> str:
+    """Call Gemini, serving repeated prompts from the prompt cache when ``cache_ttl`` is set.
+
+    If Gemini fails or its breaker is open, an expired cached response is
+    returned if one is still kept. Otherwise the result is None, or
+    resilience.UpstreamUnavailable is raised when Gemini was not tried.
+    Calls that reach Gemini take a ratelimit.admitted() slot.
+    """
+    if not cache_ttl:
+        async with ratelimit.admitted():
+            return await gemini.generate(prompt)
+    prompt_cache = cache.get_prompt_cache()
+    key = prompt_cache.make_key(prompt, os.getenv("GEMINI_API_URL"))
+    cached = await prompt_cache.get(key)
+    if cached is not None:
+        return cached
     try:
-        resp = requests.post(url, headers=headers, json=data)
-        print(f"[Gemini] Response status: {resp.status_code}")
-        print(f"[Gemini] Response body: {resp.text}")
-        resp.raise_for_status()
-        result = resp.json()
-        return result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-    except Exception as e:
-        print(f"[Gemini] Exception: {e}")
-        return None
+        response = await gemini_flights.do(key, _generate_and_cache, prompt_cache, key, prompt, cache_ttl)
+    except resilience.UpstreamUnavailable:
+        stale = await prompt_cache.get_stale(key)
+        if stale is None:
+            raise
+        return stale
+    return response or await prompt_cache.get_stale(key)
+
+async def _generate_and_cache(prompt_cache: cache.PromptCache, key: str, prompt: str, cache_ttl: float):
+    async with ratelimit.admitted():
+        response = await gemini.generate(prompt)
+    if response:
+        await prompt_cache.set(key, response, cache_ttl)
+    return response
+
+async def stream_gemini_api(prompt: str, cache_ttl: Optional[float] = None) -> AsyncIterator[str]:
+    """Stream a Gemini response in chunks; a cached response comes back as a single chunk.
+
+    A stream that completes is cached for later calls, streamed or not.
+    While Gemini's breaker is open, an expired cached response is sent if
+    one is kept. Raises gemini.GeminiError if Gemini fails. The stream
+    holds a ratelimit.admitted() slot until it ends.
+    """
+    prompt_cache = cache.get_prompt_cache()
+    key = prompt_cache.make_key(prompt, os.getenv("GEMINI_API_URL"))
+    if cache_ttl:
+        cached = await prompt_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    chunks = []
+    try:
+        async with ratelimit.admitted():
+            async for chunk in gemini.stream(prompt):
+                chunks.append(chunk)
+                yield chunk
+    except resilience.UpstreamUnavailable:
+        # Raised before anything was streamed.
+        stale = await prompt_cache.get_stale(key) if cache_ttl else None
+        if stale is None:
+            raise
+        yield stale
+        return
+    if cache_ttl and chunks:
+        await prompt_cache.set(key, "".join(chunks), cache_ttl)
 
-def update_user(db: Session, user_id: UUID, update: schemas.UserCreate):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def update_user(db: AsyncSession, user_id: UUID, update: schemas.UserCreate, hashed_password: Optional[str] = None):
+    user = await db.get(models.User, user_id)
     if not user:
         return None
     # Only update fields that are not None and not empty (for strings)
@@ -145,9 +386,53 @@ def update_user(db: Session, user_id: UUID, update: schemas.UserCreate):
     if update.status is not None and update.status != '':
         user.status = update.status
     if update.preferences is not None:
+        if update.preferences != (user.preferences or []):
+            recommendation_cache.delete(user.id)
         user.preferences = update.preferences
-    if update.password is not None and update.password != '':
-        user.password = get_password_hash(update.password)
-    db.commit()
-    db.refresh(user)
-    return user 
\ No newline at end of file
+    if hashed_password:
+        user.password = hashed_password
+    await db.commit()
+    user_cache.invalidate(user.id)
+    await db.refresh(user)
+    return user 
+
+def record_search(user_id: UUID, query_text: str) -> bool:
+    """Queue a search-history row unless it repeats the user's previous search. Returns whether it was queued."""
+    normalized = cache.normalize_prompt(query_text)
+    if last_searches.get(user_id) == normalized:
+        return False
+    last_searches.set(user_id, normalized)
+    write_behind.search_history.add(user_id=user_id, query_text=query_text, created_at=datetime.utcnow())
+    return True
+
+async def get_history_page(db: AsyncSession, model, user_id: UUID, limit: int, cursor: Optional[str] = None):
+    """A user's voice or search history, newest first, as ``(rows, next_cursor)``.
+
+    Pages follow the (user_id, created_at, id) index. Raises ValueError for a bad cursor.
+    """
+    query = select(model).where(model.user_id == user_id)
+    if cursor:
+        values = pagination.decode_cursor(cursor)
+        try:
+            last_created_at, last_id = datetime.fromisoformat(values[0]), int(values[1])
+        except (IndexError, TypeError, ValueError) as e:
+            raise ValueError("Invalid cursor") from e
+        query = query.where(tuple_(model.created_at, model.id) < tuple_(last_created_at, last_id))
+    rows = list(await db.scalars(query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = pagination.encode_cursor([rows[-1].created_at.isoformat(), rows[-1].id])
+    return rows, next_cursor
+
+async def prune_history(db: AsyncSession, model, retention_days: int = HISTORY_RETENTION_DAYS, batch_size: int = 10000) -> int:
+    """Delete history rows older than ``retention_days``, in batches to keep locks and WAL bursts short."""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = 0
+    while True:
+        expired = select(model.id).where(model.created_at < cutoff).limit(batch_size).scalar_subquery()
+        result = await db.execute(delete(model).where(model.id.in_(expired)))
+        await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
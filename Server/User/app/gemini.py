@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from . import metrics, resilience
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Timeouts are in seconds. Gemini can take a while to generate, so the read
+# timeout is generous, but connecting should never take long.
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "30"))
+# Upper bound on in-flight Gemini requests per worker process. Callers above
+# the limit wait for a free slot instead of opening more connections.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "50"))
+GEMINI_MAX_KEEPALIVE = int(os.getenv("GEMINI_MAX_KEEPALIVE", "20"))
+# Streaming endpoint; derived from GEMINI_API_URL (…:generateContent -> …:streamGenerateContent?alt=sse) when unset.
+GEMINI_STREAM_URL = os.getenv("GEMINI_STREAM_URL")
+
+class GeminiError(Exception):
+    """Gemini is not configured or did not answer (streaming only; generate() returns None)."""
+
+
+_client: Optional[httpx.AsyncClient] = None
+upstream = resilience.Upstream("gemini", GEMINI_READ_TIMEOUT)
+_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared keep-alive client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(GEMINI_READ_TIMEOUT, connect=GEMINI_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=GEMINI_MAX_CONCURRENCY,
+                max_keepalive_connections=GEMINI_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _extract_text(result: dict) -> str:
+    return result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+
+
+def _timeout(seconds: float) -> httpx.Timeout:
+    return httpx.Timeout(seconds, connect=min(GEMINI_CONNECT_TIMEOUT, seconds))
+
+
+async def generate(prompt: str) -> Optional[str]:
+    """Send a prompt to Gemini and return the generated text, or None on error.
+
+    Raises resilience.UpstreamUnavailable without calling Gemini while its
+    breaker is open or the request is out of time.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    api_url = os.getenv("GEMINI_API_URL")
+    if not api_key or not api_url:
+        logger.error("Gemini API key or URL is not configured")
+        return None
+    logger.debug("Gemini request", extra={"prompt": prompt})
+    headers = {
+        "Content-Type": "application/json",
+        "x-goog-api-key": api_key,
+    }
+    data = {
+        "contents": [{"parts": [{"text": prompt}]}]
+    }
+
+    async def attempt(timeout: float) -> httpx.Response:
+        async with _semaphore:
+            started = time.perf_counter()
+            try:
+                resp = await get_client().post(api_url, headers=headers, json=data, timeout=_timeout(timeout))
+            except Exception:
+                metrics.observe_upstream("gemini", "error", time.perf_counter() - started)
+                raise
+            elapsed = time.perf_counter() - started
+            metrics.observe_upstream("gemini", resp.status_code, elapsed)
+        if resp.is_error:
+            logger.warning("Gemini returned an error", extra={"status": resp.status_code, "body": resp.text})
+            raise resilience.UpstreamError(resp.status_code)
+        logger.debug("Gemini response", extra={"status": resp.status_code, "elapsed_ms": round(elapsed * 1000), "body": resp.text})
+        return resp
+
+    try:
+        resp = await upstream.call(attempt)
+        return _extract_text(resp.json())
+    except resilience.UpstreamUnavailable:
+        raise
+    except resilience.UpstreamError:
+        return None
+    except Exception as e:
+        # Not the exception itself: httpx errors repeat the request URL, which may carry the key.
+        logger.warning("Gemini request failed", extra={"error": type(e).__name__})
+        return None
+
+
+def _stream_url(api_url: str) -> str:
+    if GEMINI_STREAM_URL:
+        return GEMINI_STREAM_URL
+    base, _, query = api_url.partition("?")
+    base = base.replace(":generateContent", ":streamGenerateContent")
+    return f"{base}?alt=sse&{query}" if query else f"{base}?alt=sse"
+
+
+async def stream(prompt: str) -> AsyncIterator[str]:
+    """Yield generated text from Gemini as it arrives; raises GeminiError on failure.
+
+    Not retried (text may already have been sent on), but it counts towards
+    Gemini's breaker and fails fast with UpstreamUnavailable while it is open.
+    Reads are bounded by the request's deadline, and the stream fails once it passes.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    api_url = os.getenv("GEMINI_API_URL")
+    if not api_key or not api_url:
+        logger.error("Gemini API key or URL is not configured")
+        raise GeminiError("Gemini is not configured")
+    headers = {
+        "Content-Type": "application/json",
+        "x-goog-api-key": api_key,
+    }
+    data = {
+        "contents": [{"parts": [{"text": prompt}]}]
+    }
+    logger.debug("Gemini stream request", extra={"prompt": prompt})
+    seconds = upstream.attempt_timeout()
+    upstream.check()
+    error = None
+    async with _semaphore:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            async with get_client().stream("POST", _stream_url(api_url), headers=headers, json=data,
+                                           timeout=_timeout(seconds)) as resp:
+                status = resp.status_code
+                if resp.is_error:
+                    body = (await resp.aread()).decode("utf-8", "replace")
+                    logger.warning("Gemini returned an error", extra={"status": resp.status_code, "body": body})
+                    error = resilience.UpstreamError(resp.status_code)
+                    raise GeminiError(f"Gemini returned {resp.status_code}")
+                async for line in resp.aiter_lines():
+                    # The timeout above bounds each read; this bounds the whole stream.
+                    left = resilience.remaining()
+                    if left is not None and left <= 0:
+                        # Neutral for the breaker: the request ran out of time, not Gemini.
+                        logger.warning("Gemini stream failed", extra={"error": "request deadline passed"})
+                        raise GeminiError("Request deadline passed")
+                    # Server-sent events: one "data: {...}" line per chunk of the response.
+                    if line.startswith("data:"):
+                        try:
+                            chunk = json.loads(line[5:])
+                        except ValueError:
+                            error = resilience.UpstreamError(502, "malformed stream chunk")
+                            logger.warning("Gemini stream failed", extra={"error": "malformed chunk"})
+                            raise GeminiError("Gemini sent a malformed stream chunk") from None
+                        text = _extract_text(chunk)
+                        if text:
+                            yield text
+        except httpx.HTTPError as e:
+            error = e
+            logger.warning("Gemini stream failed", extra={"error": type(e).__name__})
+            raise GeminiError("Gemini request failed") from None
+        except BaseException as e:
+            # E.g. the consumer going away (GeneratorExit, CancelledError): neutral for the breaker.
+            if error is None:
+                error = e
+            raise
+        finally:
+            upstream.record(error, seconds)
+            metrics.observe_upstream("gemini_stream", status, time.perf_counter() - started)
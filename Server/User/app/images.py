@@ -0,0 +1,208 @@
+"""Background image resolution for recipes created without an image.
+
+Creating a recipe only queues a job, so Openverse latency never delays the
+insert. IMAGE_WORKERS tasks take (recipe, title) jobs off a bounded queue,
+find an image through the image_lookups table, and fill in the recipe's
+image_url. Only cache misses go to Openverse.
+
+Every lookup is cached by normalized title. That includes lookups that found
+nothing; those are retried after IMAGE_NEGATIVE_TTL_HOURS. Jobs that arrive
+while the queue is full are dropped. On startup, recipes that still have no
+image are queued again, so dropped jobs and jobs lost in a restart are
+picked up later.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Set
+from uuid import UUID
+
+import httpx
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from . import metrics, models, resilience
+from .database import AsyncSessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", "1000"))
+IMAGE_LOOKUP_TIMEOUT = float(os.getenv("IMAGE_LOOKUP_TIMEOUT", "10"))
+# How long "Openverse had nothing for this title" is trusted before asking again.
+IMAGE_NEGATIVE_TTL_HOURS = float(os.getenv("IMAGE_NEGATIVE_TTL_HOURS", "24"))
+
+OPENVERSE_URL = "https://api.openverse.engineering/v1/images/"
+
+_queue: Optional[asyncio.Queue] = None
+_workers: list = []
+_queued: Set[UUID] = set()
+_client: Optional[httpx.AsyncClient] = None
+upstream = resilience.Upstream("openverse", IMAGE_LOOKUP_TIMEOUT)
+
+# Counters for /metrics.
+hits = 0
+misses = 0
+dropped = 0
+resolved = 0
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient()
+    return _client
+
+
+async def _search(params: dict) -> Optional[str]:
+    async def attempt(timeout: float) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            resp = await _get_client().get(OPENVERSE_URL, params=params, timeout=timeout)
+        except Exception:
+            metrics.observe_upstream("openverse", "error", time.perf_counter() - started)
+            raise
+        metrics.observe_upstream("openverse", resp.status_code, time.perf_counter() - started)
+        if resp.is_error:
+            raise resilience.UpstreamError(resp.status_code)
+        return resp
+
+    results = (await upstream.call(attempt)).json().get("results")
+    return results[0]["url"] if results else None
+
+
+async def fetch_openverse_image(query: str) -> Optional[str]:
+    """First Openverse image for ``query``, preferring commercially licensed ones.
+
+    Returns None when Openverse has nothing; raises if it couldn't be asked.
+    """
+    try:
+        url = await _search({"q": query, "page_size": 1, "filter": "license_type:commercial"})
+        if url:
+            return url
+    except resilience.UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.warning("Openverse lookup failed", extra={"query": query, "licence": "commercial", "error": str(e)})
+    return await _search({"q": query, "page_size": 1})
+
+
+async def resolve(query: str, query_key: str) -> Optional[str]:
+    """Image URL for a recipe title, from the lookup cache or Openverse."""
+    global hits, misses
+    # The Openverse call can take seconds, so no connection is held across it.
+    async with AsyncSessionLocal() as db:
+        cached = await db.get(models.ImageLookup, query_key)
+    if cached is not None and (
+        cached.image_url
+        or cached.looked_up_at > datetime.utcnow() - timedelta(hours=IMAGE_NEGATIVE_TTL_HOURS)
+    ):
+        hits += 1
+        return cached.image_url
+    misses += 1
+    # Transient failures raise here and are not cached.
+    image_url = await fetch_openverse_image(query)
+    stmt = pg_insert(models.ImageLookup).values(query_key=query_key, image_url=image_url)
+    async with AsyncSessionLocal() as db:
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[models.ImageLookup.query_key],
+            set_={"image_url": stmt.excluded.image_url, "looked_up_at": stmt.excluded.looked_up_at},
+        ))
+        await db.commit()
+    return image_url
+
+
+async def _fill(recipe_id: UUID, title: str, query_key: str):
+    global resolved
+    image_url = await resolve(title, query_key)
+    if not image_url:
+        return
+    async with AsyncSessionLocal() as db:
+        # Don't overwrite an image set by the user in the meantime.
+        await db.execute(
+            update(models.Recipe)
+            .where(models.Recipe.id == recipe_id, models.Recipe.image_url.is_(None))
+            .values(image_url=image_url)
+        )
+        await db.commit()
+    resolved += 1
+
+
+async def _worker():
+    while True:
+        recipe_id, title, query_key = await _queue.get()
+        retry_after = None
+        try:
+            await _fill(recipe_id, title, query_key)
+        except resilience.UpstreamUnavailable as e:
+            retry_after = e.retry_after
+        except Exception as e:
+            logger.warning("Image resolution failed", extra={"recipe_id": recipe_id, "query": title, "error": str(e)})
+        finally:
+            _queued.discard(recipe_id)
+            _queue.task_done()
+        if retry_after is not None:
+            # Openverse is down: hold this worker until the breaker's next trial, then retry the job.
+            await asyncio.sleep(retry_after)
+            enqueue(recipe_id, title, query_key)
+
+
+def enqueue(recipe_id: UUID, title: str, query_key: str) -> bool:
+    """Queue a recipe for image resolution; False if it was dropped (queue full or not started)."""
+    global dropped
+    if recipe_id in _queued:
+        return True
+    if _queue is None:
+        dropped += 1
+        return False
+    try:
+        _queue.put_nowait((recipe_id, title, query_key))
+    except asyncio.QueueFull:
+        dropped += 1
+        return False
+    _queued.add(recipe_id)
+    return True
+
+
+def pending() -> int:
+    return _queue.qsize() if _queue is not None else 0
+
+
+async def enqueue_missing():
+    """Queue recipes that still have no image, up to the queue's free space."""
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(models.Recipe.id, models.Recipe.title, models.Recipe.title_key)
+            .where(models.Recipe.image_url.is_(None))
+            .limit(IMAGE_QUEUE_SIZE - pending())
+        )).all()
+    for recipe_id, title, title_key in rows:
+        enqueue(recipe_id, title, title_key or title.lower())
+    if rows:
+        logger.info("Queued recipes without images", extra={"count": len(rows)})
+
+
+def start():
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(IMAGE_QUEUE_SIZE)
+        _workers.extend(asyncio.create_task(_worker()) for _ in range(IMAGE_WORKERS))
+
+
+async def stop():
+    """Cancel the workers; queued jobs are picked up by enqueue_missing() on the next start."""
+    global _queue, _client
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queued.clear()
+    _queue = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
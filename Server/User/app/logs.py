@@ -0,0 +1,184 @@
+"""Structured JSON logging.
+
+Modules log through ``logging.getLogger(__name__)`` with any structured fields
+passed as ``extra``. setup() routes everything through a bounded queue, so a
+request thread only copies the record. A background listener formats each
+record as one JSON line on stdout. When the queue is full, records are
+dropped and counted rather than blocking the caller.
+
+Before a record is written, fields named like secrets are redacted and long
+strings are cut to LOG_MAX_FIELD_CHARS. Every record made while a request is
+being handled carries that request's ``request_id``. The id comes from the
+X-Request-ID header if the client sent one, and is echoed back in the
+response.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import traceback
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-logger overrides, e.g. "app.gemini=DEBUG,app.routers=WARNING".
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Applied before LOG_LEVELS. httpx logs full request URLs at INFO, and the
+# Gemini URL may carry the API key; the pool classes log every dispose.
+_DEFAULT_LEVELS = {"httpx": "WARNING", "httpcore": "WARNING", "app.database": "WARNING"}
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "500"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REDACTED_FIELDS = {"api_key", "authorization", "password", "hashed_password", "token", "access_token", "secret"}
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["_QueueHandler"] = None
+
+
+def _clip(value):
+    if isinstance(value, str) and len(value) > LOG_MAX_FIELD_CHARS:
+        return f"{value[:LOG_MAX_FIELD_CHARS]}...[{len(value) - LOG_MAX_FIELD_CHARS} more chars]"
+    return value
+
+
+def _clean(key: str, value):
+    if key.lower() in REDACTED_FIELDS:
+        return "[redacted]"
+    if isinstance(value, dict):
+        return {k: _clean(str(k), v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(key, v) for v in value]
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return _clip(str(value))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _clip(record.getMessage()),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = _clean(key, value)
+        if record.exc_text:
+            # Tracebacks are kept whole; they are rare and need every frame.
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Stamps the request id and never blocks: records are dropped when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Leave JSON formatting to the listener; only resolve what can't cross threads.
+        record = copy.copy(record)
+        record.request_id = _request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _apply_levels():
+    logging.getLogger().setLevel(LOG_LEVEL)
+    levels = dict(_DEFAULT_LEVELS)
+    for item in LOG_LEVELS.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def setup():
+    """Install the queue handler on the root logger (idempotent)."""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    _handler = _QueueHandler(log_queue)
+    root.addHandler(_handler)
+    _apply_levels()
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def dropped() -> int:
+    """Records discarded because the queue was full."""
+    return _handler.dropped if _handler is not None else 0
+
+
+def shutdown():
+    """Write out whatever is still queued and stop the listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """ASGI middleware binding a request id to everything logged while handling the request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rid = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                rid = value.decode("latin-1")[:64]
+                break
+        rid = rid or uuid.uuid4().hex
+        token = _request_id.set(rid)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_id.reset(token)
@@ -0,0 +1,234 @@
+"""Prometheus metrics for requests, SQL, upstream APIs and caches.
+
+MetricsMiddleware times every request under its route template (not the raw
+path, which would explode label cardinality) and, through SQLAlchemy engine
+events, counts the queries each request ran and how long they took. Cache
+and pool figures are read from their owners when /metrics is scraped.
+Metrics are per worker process.
+"""
+import contextvars
+import time
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from sqlalchemy import event
+
+from . import cache, database, logs, profiler, write_behind
+from .user_cache import user_cache
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUEST_SQL_QUERIES = Histogram(
+    "http_request_sql_queries", "SQL statements executed per request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+REQUEST_SQL_SECONDS = Histogram(
+    "http_request_sql_seconds", "Time spent in SQL per request",
+    ["route"], buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+SQL_QUERIES = Counter("sql_queries_total", "SQL statements executed", ["engine"])
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to external APIs",
+    ["upstream", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+
+
+class _RequestStats:
+    __slots__ = ("queries", "sql_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+_request_stats: contextvars.ContextVar[Optional[_RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def _instrument_engine(engine, name: str):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        SQL_QUERIES.labels(name).inc()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+_instrument_engine(database.async_engine.sync_engine, "async")
+_instrument_engine(database.engine, "sync")
+
+
+def observe_upstream(upstream: str, status, seconds: float):
+    """Record one call to an external API; ``status`` is the HTTP status or "error"."""
+    UPSTREAM_LATENCY.labels(upstream, str(status)).observe(seconds)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and SQL usage per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+        sample = profiler.start_request()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(elapsed)
+            REQUEST_SQL_QUERIES.labels(route).observe(stats.queries)
+            REQUEST_SQL_SECONDS.labels(route).observe(stats.sql_seconds)
+            profiler.finish_request(sample, f"{scope['method']} {route}", elapsed)
+
+
+class _StateCollector:
+    """Exports cache, pool and write-behind figures, read at scrape time."""
+
+    def describe(self):
+        # Skip the trial collect() prometheus_client runs on register; it happens at import time.
+        return []
+
+    def collect(self):
+        lookups = CounterMetricFamily("cache_lookups", "Cache lookups by cache and result", labels=["cache", "result"])
+        prompt = cache.get_prompt_cache().stats()
+        lookups.add_metric(["gemini_prompt", "memory_hit"], prompt["memory_hits"])
+        lookups.add_metric(["gemini_prompt", "disk_hit"], prompt["disk_hits"])
+        lookups.add_metric(["gemini_prompt", "stale_hit"], prompt["stale_hits"])
+        lookups.add_metric(["gemini_prompt", "miss"], prompt["misses"])
+        # Imported here: crud (through gemini) and images report to this module.
+        from . import crud, images
+        for name, lru in (("recommendations", crud.recommendation_cache), ("search_dedup", crud.last_searches)):
+            lookups.add_metric([name, "hit"], lru.hits)
+            lookups.add_metric([name, "miss"], lru.misses)
+        lookups.add_metric(["auth_user", "hit"], user_cache.hits)
+        lookups.add_metric(["auth_user", "miss"], user_cache.misses)
+        lookups.add_metric(["openverse_image", "hit"], images.hits)
+        lookups.add_metric(["openverse_image", "miss"], images.misses)
+        yield lookups
+
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Share of lookups answered from cache", labels=["cache"])
+        ratio.add_metric(["gemini_prompt"], prompt["hit_ratio"])
+        for name, hits, misses in (
+            ("recommendations", crud.recommendation_cache.hits, crud.recommendation_cache.misses),
+            ("auth_user", user_cache.hits, user_cache.misses),
+        ):
+            ratio.add_metric([name], hits / (hits + misses) if hits + misses else 0.0)
+        yield ratio
+
+        pools = database.pool_stats()
+        for key, help_text in (
+            ("checked_out", "Connections currently checked out"),
+            ("overflow", "Connections opened beyond the pool size"),
+        ):
+            gauge = GaugeMetricFamily(f"db_pool_{key}", help_text, labels=["engine"])
+            for engine_name, stats in pools.items():
+                gauge.add_metric([engine_name], stats[key])
+            yield gauge
+        waits = CounterMetricFamily("db_pool_checkout_wait_seconds", "Total time spent waiting for a connection", labels=["engine"])
+        timeouts = CounterMetricFamily("db_pool_checkout_timeouts", "Checkouts that gave up waiting", labels=["engine"])
+        for engine_name, stats in pools.items():
+            waits.add_metric([engine_name], stats["total_checkout_wait_ms"] / 1000)
+            timeouts.add_metric([engine_name], stats["checkout_timeouts"])
+        yield waits
+        yield timeouts
+
+        written = CounterMetricFamily("write_behind_rows_written", "Rows written by the buffered writers", labels=["table"])
+        dropped = CounterMetricFamily("write_behind_rows_dropped", "Rows dropped because the buffer was full", labels=["table"])
+        rejected = CounterMetricFamily("write_behind_rows_rejected", "Rows dropped because the database refused them", labels=["table"])
+        pending = GaugeMetricFamily("write_behind_rows_pending", "Rows waiting to be written", labels=["table"])
+        for writer in write_behind.writers:
+            table = writer.model.__tablename__
+            written.add_metric([table], writer.written)
+            dropped.add_metric([table], writer.dropped)
+            rejected.add_metric([table], writer.rejected)
+            pending.add_metric([table], len(writer))
+        yield written
+        yield dropped
+        yield rejected
+        yield pending
+
+        image_jobs = GaugeMetricFamily("image_jobs_pending", "Recipes waiting for an image lookup")
+        image_jobs.add_metric([], images.pending())
+        yield image_jobs
+        image_dropped = CounterMetricFamily("image_jobs_dropped", "Image lookups skipped because the queue was full")
+        image_dropped.add_metric([], images.dropped)
+        yield image_dropped
+
+        from .routers.recipes import recipe_prefetcher
+        prefetch_jobs = CounterMetricFamily("recipe_prefetch_jobs", "Background recipe generations by outcome", labels=["outcome"])
+        prefetch_jobs.add_metric(["completed"], recipe_prefetcher.completed)
+        prefetch_jobs.add_metric(["failed"], recipe_prefetcher.failed)
+        prefetch_jobs.add_metric(["dropped"], recipe_prefetcher.dropped)
+        yield prefetch_jobs
+        prefetch_pending = GaugeMetricFamily("recipe_prefetch_pending", "Recipe generations waiting for a prefetch worker")
+        prefetch_pending.add_metric([], len(recipe_prefetcher))
+        yield prefetch_pending
+
+        from . import gemini
+        breaker = GaugeMetricFamily("upstream_breaker_open", "1 while the upstream's circuit breaker is open or half-open", labels=["upstream"])
+        breaker_opened = CounterMetricFamily("upstream_breaker_opened", "Times the upstream's breaker has opened", labels=["upstream"])
+        retries = CounterMetricFamily("upstream_retries", "Retried upstream calls", labels=["upstream"])
+        rejected = CounterMetricFamily("upstream_rejected", "Calls failed fast without reaching the upstream", labels=["upstream"])
+        for upstream in (gemini.upstream, images.upstream):
+            breaker.add_metric([upstream.name], 0 if upstream.breaker.state == "closed" else 1)
+            breaker_opened.add_metric([upstream.name], upstream.breaker.opened)
+            retries.add_metric([upstream.name], upstream.retries)
+            rejected.add_metric([upstream.name], upstream.rejected)
+        yield breaker
+        yield breaker_opened
+        yield retries
+        yield rejected
+
+        from . import ratelimit
+        limited = CounterMetricFamily("rate_limited_requests", "Requests refused with 429", labels=["limiter", "reason"])
+        limited.add_metric([ratelimit.ai_rate_limit.name, "rate"], ratelimit.ai_rate_limit.rejected)
+        limited.add_metric([ratelimit.ai_concurrency.name, "concurrency"], ratelimit.ai_concurrency.rejected)
+        yield limited
+        in_flight = GaugeMetricFamily("admitted_calls_in_flight", "Upstream calls holding a concurrency-limit slot", labels=["limiter"])
+        in_flight.add_metric([ratelimit.ai_concurrency.name], ratelimit.ai_concurrency.in_flight)
+        yield in_flight
+
+        log_dropped = CounterMetricFamily("log_records_dropped", "Log records discarded because the log queue was full")
+        log_dropped.add_metric([], logs.dropped())
+        yield log_dropped
+
+
+REGISTRY.register(_StateCollector())
+
+
+def render() -> tuple:
+    """The current metrics in Prometheus text format, with their content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
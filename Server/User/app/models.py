@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Text, JSON, TIMESTAMP
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Text, JSON, TIMESTAMP, Index, Float, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship, declarative_base
 
@@ -20,27 +20,46 @@ class User(Base):
     favorites = relationship('Favorite', back_populates='user')
     grocery_items = relationship('GroceryChecklist', back_populates='user')
     voice_queries = relationship('VoiceQuery', back_populates='user')
+    search_history = relationship('SearchHistory', back_populates='user')
 
 class Recipe(Base):
     __tablename__ = 'recipes'
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     title = Column(String(100), nullable=False)
+    # Lowercased, punctuation/whitespace-collapsed title used for cache lookups (see crud.normalize_title)
+    title_key = Column(String(100), index=True)
     image_url = Column(Text)
     ingredients = Column(Text, nullable=False)
     steps = Column(Text, nullable=False)
+    # Structured copies of ingredients/steps: [{"text", "name", "quantity", "unit"}, ...] and [step, ...]
+    ingredient_items = Column(JSONB)
+    step_items = Column(JSONB)
     reference = Column(Text)
     tags = Column(JSONB, default=list)
     difficulty = Column(String(20))
     estimated_time = Column(Integer)
     created_by = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='SET NULL'))
+    created_at = Column(TIMESTAMP, nullable=False, server_default=text("timezone('utc', now())"), index=True)
     creator = relationship('User', back_populates='recipes')
     interactions = relationship('UserRecipeInteraction', back_populates='recipe')
     favorites = relationship('Favorite', back_populates='recipe')
 
+    __table_args__ = (
+        # One AI-generated (creator-less) recipe per normalized title
+        Index('uq_recipes_ai_title_key', 'title_key', unique=True, postgresql_where=created_by.is_(None)),
+        # Containment queries such as ingredient_items @> '[{"name": "garlic"}]'
+        Index('ix_recipes_ingredient_items', 'ingredient_items', postgresql_using='gin', postgresql_ops={'ingredient_items': 'jsonb_path_ops'}),
+        # tags ?| preferences (crud.get_recommendations)
+        Index('ix_recipes_tags', 'tags', postgresql_using='gin'),
+        # Keyset pagination (crud.get_recipes_page)
+        Index('ix_recipes_title_id', 'title', 'id'),
+        Index('ix_recipes_estimated_time_id', 'estimated_time', 'id'),
+    )
+
 class UserRecipeInteraction(Base):
     __tablename__ = 'user_recipe_interaction'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'))
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), index=True)
     recipe_id = Column(UUID(as_uuid=True), ForeignKey('recipes.id', ondelete='CASCADE'))
     liked = Column(Boolean, default=False)
     viewed_at = Column(TIMESTAMP)
@@ -50,12 +69,19 @@ class UserRecipeInteraction(Base):
 class Favorite(Base):
     __tablename__ = 'favorites'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'))
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), index=True)
     recipe_id = Column(UUID(as_uuid=True), ForeignKey('recipes.id', ondelete='CASCADE'))
     added_at = Column(TIMESTAMP)
     user = relationship('User', back_populates='favorites')
     recipe = relationship('Recipe', back_populates='favorites')
 
+class RecipeNeighbor(Base):
+    """Precomputed item-item similarity (see app/similarity.py)."""
+    __tablename__ = 'recipe_neighbors'
+    recipe_id = Column(UUID(as_uuid=True), ForeignKey('recipes.id', ondelete='CASCADE'), primary_key=True)
+    neighbor_id = Column(UUID(as_uuid=True), ForeignKey('recipes.id', ondelete='CASCADE'), primary_key=True)
+    score = Column(Float, nullable=False)
+
 class GroceryChecklist(Base):
     __tablename__ = 'grocery_checklist'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -70,5 +96,39 @@ class VoiceQuery(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='SET NULL'))
     query_text = Column(Text, nullable=False)
-    created_at = Column(TIMESTAMP)
-    user = relationship('User', back_populates='voice_queries') 
\ No newline at end of file
+    created_at = Column(TIMESTAMP, nullable=False, server_default=text("timezone('utc', now())"))
+    user = relationship('User', back_populates='voice_queries')
+    __table_args__ = (
+        # A user's history, newest first, read straight off the index
+        Index('ix_voice_queries_user_created', 'user_id', 'created_at', 'id'),
+        # Retention deletes by age; BRIN stays tiny on an append-only, time-ordered table
+        Index('ix_voice_queries_created_at_brin', 'created_at', postgresql_using='brin'),
+    )
+
+class SearchHistory(Base):
+    __tablename__ = 'search_history'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    query_text = Column(Text, nullable=False)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=text("timezone('utc', now())"))
+    user = relationship('User', back_populates='search_history')
+    __table_args__ = (
+        Index('ix_search_history_user_created', 'user_id', 'created_at', 'id'),
+        Index('ix_search_history_created_at_brin', 'created_at', postgresql_using='brin'),
+    )
+
+class RevokedToken(Base):
+    """JWTs revoked by /logout before their expiry (see app/revocation.py)."""
+    __tablename__ = 'revoked_tokens'
+    jti = Column(String(36), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'))
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
+    # Set by the database so every worker's incremental refresh uses one clock.
+    revoked_at = Column(TIMESTAMP, nullable=False, server_default=text("timezone('utc', now())"), index=True)
+
+class ImageLookup(Base):
+    """Openverse results per normalized query (see app/images.py); a NULL image_url means nothing was found."""
+    __tablename__ = 'image_lookups'
+    query_key = Column(String(100), primary_key=True)
+    image_url = Column(Text)
+    looked_up_at = Column(TIMESTAMP, nullable=False, server_default=text("timezone('utc', now())"))
@@ -0,0 +1,216 @@
+"""In-memory inverted index for "cook with what I have" searches.
+
+Every ingredient line of every recipe gets a global slot number. Each
+ingredient word maps to the (ascending) array of slots it appears in, so a
+pantry item such as "soy sauce" covers the intersection of the "soy" and
+"sauce" postings. Counting covered slots per recipe then gives coverage and
+the number of missing ingredients without touching the database.
+
+Each worker builds its own index at startup and adds the recipes it creates
+itself. Recipes created through other workers are picked up by a periodic
+refresh (every PANTRY_INDEX_REFRESH_SECONDS) of rows created since the last
+one.
+"""
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models, recipe_parser
+from .database import AsyncSessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PANTRY_INDEX_REFRESH_SECONDS = float(os.getenv("PANTRY_INDEX_REFRESH_SECONDS", "30"))
+# Re-read this far behind the newest created_at seen, so rows from
+# transactions that committed out of order are not missed.
+_REFRESH_OVERLAP = timedelta(seconds=60)
+
+_WORD = re.compile(r"[a-z]+")
+# Words that describe an ingredient rather than identify it.
+_STOPWORDS = frozenset([
+    "a", "an", "and", "or", "of", "the", "to", "for", "with", "taste", "optional", "fresh",
+    "chopped", "minced", "sliced", "diced", "cubed", "crushed", "large", "small", "medium",
+])
+
+
+def _stem(word: str) -> str:
+    # Crude plural folding; only has to agree with itself on both sides of a lookup.
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "i"
+    if word.endswith("y") and len(word) > 3:
+        return word[:-1] + "i"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def ingredient_terms(name: str) -> frozenset:
+    return frozenset(_stem(w) for w in _WORD.findall(name.lower()) if w not in _STOPWORDS)
+
+
+class PantryMatch:
+    __slots__ = ("recipe_id", "matched", "total", "missing_positions")
+
+    def __init__(self, recipe_id: UUID, matched: int, total: int, missing_positions: List[int]):
+        self.recipe_id = recipe_id
+        self.matched = matched
+        self.total = total
+        self.missing_positions = missing_positions
+
+    @property
+    def missing(self) -> int:
+        return self.total - self.matched
+
+    @property
+    def coverage(self) -> float:
+        return self.matched / self.total if self.total else 0.0
+
+
+class PantryIndex:
+    def __init__(self):
+        self.ready = False
+        self._since: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._recipe_ids: List[UUID] = []
+        self._recipe_pos: Dict[UUID, int] = {}
+        self._first_slot = array("I")
+        self._slot_count = array("H")
+        self._slot_recipe = array("I")
+        self._postings: Dict[str, array] = {}
+
+    def __len__(self):
+        return len(self._recipe_ids)
+
+    def add_recipe(self, recipe_id: UUID, names: Iterable[str]):
+        """Index a recipe's ingredient names. Recipes that are already indexed are ignored."""
+        terms = [ingredient_terms(name) for name in names]
+        with self._lock:
+            if recipe_id in self._recipe_pos:
+                return
+            pos = len(self._recipe_ids)
+            first = len(self._slot_recipe)
+            for offset, slot_terms in enumerate(terms):
+                slot = first + offset
+                self._slot_recipe.append(pos)
+                for term in slot_terms:
+                    posting = self._postings.get(term)
+                    if posting is None:
+                        posting = self._postings[term] = array("I")
+                    posting.append(slot)
+            self._first_slot.append(first)
+            self._slot_count.append(len(terms))
+            # Publish the recipe last so concurrent searches never see half of it.
+            self._recipe_ids.append(recipe_id)
+            self._recipe_pos[recipe_id] = pos
+
+    def add(self, recipe: models.Recipe):
+        self.add_recipe(recipe.id, recipe_ingredient_names(recipe))
+
+    def search(self, pantry: Iterable[str], limit: int = 20, max_missing: Optional[int] = None) -> List[PantryMatch]:
+        """Rank recipes by the share of their ingredients covered by ``pantry``, then by fewest missing."""
+        covered = set()
+        for item in pantry:
+            terms = ingredient_terms(item)
+            if not terms:
+                continue
+            postings = [self._postings.get(term) for term in terms]
+            if any(p is None for p in postings):
+                continue
+            postings.sort(key=len)
+            slots = set(postings[0])
+            for posting in postings[1:]:
+                slots.intersection_update(posting)
+            covered |= slots
+
+        indexed = len(self._recipe_ids)
+        slot_count = self._slot_count
+        matched_by_recipe = Counter(map(self._slot_recipe.__getitem__, covered))
+        # (-coverage, missing, pos): the smallest tuples are the best matches.
+        candidates = [
+            (-matched / slot_count[pos], slot_count[pos] - matched, pos)
+            for pos, matched in matched_by_recipe.items()
+            if pos < indexed
+        ]
+        if max_missing is not None:
+            candidates = [c for c in candidates if c[1] <= max_missing]
+        top = heapq.nsmallest(limit, candidates)
+
+        results = []
+        for _, missing, pos in top:
+            first, total = self._first_slot[pos], self._slot_count[pos]
+            missing_positions = [i for i in range(total) if first + i not in covered]
+            results.append(PantryMatch(self._recipe_ids[pos], total - missing, total, missing_positions))
+        return results
+
+    def build(self, db: Session, batch_size: int = 1000):
+        """Index every recipe in the database (recipes indexed meanwhile are skipped)."""
+        started = time.perf_counter()
+        # Recipes committed during the scan are caught by the first refresh.
+        since = db.scalar(select(func.timezone("utc", func.now())))
+        rows = (
+            db.query(models.Recipe.id, models.Recipe.ingredient_items, models.Recipe.ingredients)
+            .execution_options(yield_per=batch_size)
+        )
+        for recipe_id, items, ingredients in rows:
+            self.add_recipe(recipe_id, ingredient_names(items, ingredients))
+        self._since = since
+        self.ready = True
+        logger.info("Pantry index built", extra={
+            "recipes": len(self), "terms": len(self._postings),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000)})
+
+    async def refresh(self, db: AsyncSession) -> int:
+        """Index recipes created since the build or the last refresh; returns how many were new."""
+        if self._since is None:
+            return 0
+        rows = (await db.execute(
+            select(models.Recipe.id, models.Recipe.ingredient_items, models.Recipe.ingredients, models.Recipe.created_at)
+            .where(models.Recipe.created_at >= self._since - _REFRESH_OVERLAP)
+        )).all()
+        before = len(self)
+        for recipe_id, items, ingredients, created_at in rows:
+            self.add_recipe(recipe_id, ingredient_names(items, ingredients))
+            if created_at > self._since:
+                self._since = created_at
+        return len(self) - before
+
+
+def ingredient_names(ingredient_items: Optional[list], ingredients: Optional[str]) -> List[str]:
+    """Ingredient names in display order, parsing the text column for rows not yet backfilled."""
+    if ingredient_items is not None:
+        return [item["name"] for item in ingredient_items]
+    return [recipe_parser.parse_ingredient(line)["name"] for line in (ingredients or "").split("\n") if line.strip()]
+
+
+def recipe_ingredient_names(recipe: models.Recipe) -> List[str]:
+    return ingredient_names(recipe.ingredient_items, recipe.ingredients)
+
+
+index = PantryIndex()
+
+
+async def run_refresh():
+    try:
+        async with AsyncSessionLocal() as db:
+            added = await index.refresh(db)
+        if added:
+            logger.info("Pantry index refreshed", extra={"added": added, "recipes": len(index)})
+    except Exception:
+        logger.exception("Pantry index refresh failed")
@@ -0,0 +1,107 @@
+"""bcrypt hashing in a dedicated process pool.
+
+bcrypt is deliberately slow CPU work; run inline it holds the GIL and a
+request thread for its whole duration. Here it runs in a small pool of
+worker processes behind an async interface. When more requests are waiting
+than PASSWORD_HASH_MAX_PENDING allows, new ones are rejected with
+HasherBusy (answered as 503 by main.py) instead of piling up.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_RETRY_AFTER = 1
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class HasherBusy(Exception):
+    """Raised when the password hashing queue is full."""
+
+
+def hash_password_sync(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password_sync(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True if the hash was made with a different cost factor than BCRYPT_ROUNDS."""
+    # $2b$12$<salt+hash>
+    parts = hashed_password.split("$")
+    try:
+        return int(parts[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return pwd_context.needs_update(hashed_password)
+
+
+def _warm_up():
+    return None
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending = 0
+
+
+def start():
+    """Create the pool and spawn its workers so the first login doesn't pay for it."""
+    global _executor
+    if _executor is None:
+        # spawn: don't fork a process that already runs the event loop and threadpool
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        for _ in range(PASSWORD_HASH_WORKERS):
+            _executor.submit(_warm_up)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HasherBusy()
+    start()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(hash_password_sync, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Check a password; returns ``(valid, new_hash)``.
+
+    ``new_hash`` is set when the password is valid but was hashed with an
+    outdated cost factor, so the caller can store the upgraded hash.
+    """
+    valid = await _run(verify_password_sync, password, hashed_password)
+    if valid and needs_rehash(hashed_password):
+        return True, await _run(hash_password_sync, password)
+    return valid, None
+
+
+def pending() -> int:
+    return _pending
@@ -0,0 +1,71 @@
+import asyncio
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, Hashable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Bounded pool of background workers for speculative work, lowest priority value first.
+
+    Jobs with the same key are queued once. Jobs with equal priority run in the
+    order they were submitted. submit() never waits: when the queue is full
+    the job is dropped, because prefetching is only an optimisation.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: list = []
+        self._keys: Set[Hashable] = set()
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, priority: int, key: Hashable, fn: Callable[..., Awaitable[Any]], *args) -> bool:
+        """Queue ``fn(*args)``; False if it was dropped (queue full or not started)."""
+        if key in self._keys:
+            return True
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait((priority, next(self._seq), key, fn, args))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self._keys.add(key)
+        return True
+
+    async def _worker(self):
+        while True:
+            _, _, key, fn, args = await self._queue.get()
+            try:
+                await fn(*args)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Prefetch failed", extra={"key": key, "error": str(e)})
+            finally:
+                self._keys.discard(key)
+                self._queue.task_done()
+
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(self.max_pending)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers and forget queued jobs."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._keys.clear()
+        self._queue = None
@@ -0,0 +1,94 @@
+"""Optional sampling profiler for slow requests.
+
+With PROFILE_SLOW_REQUESTS_MS set, a background thread samples the stacks of
+every thread in the process every PROFILE_SAMPLE_INTERVAL_MS while requests
+are in flight. Each sample is credited to all in-flight requests (the
+event loop interleaves them, so this is approximate under concurrency).
+When a request takes longer than the threshold, its samples are written to
+PROFILE_DIR in folded format (``frame;frame;frame count``), which
+flamegraph.pl and speedscope read directly.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SLOW_REQUESTS_MS = float(os.getenv("PROFILE_SLOW_REQUESTS_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+_lock = threading.Lock()
+_active: Dict[int, Counter] = {}
+_next_id = 0
+_thread: Optional[threading.Thread] = None
+
+
+def _fold(frame, thread_name: str) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+def _sample_loop():
+    interval = PROFILE_SAMPLE_INTERVAL_MS / 1000
+    me = threading.get_ident()
+    while True:
+        time.sleep(interval)
+        if not _active:
+            continue
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = [
+            _fold(frame, names.get(ident, str(ident)))
+            for ident, frame in sys._current_frames().items()
+            if ident != me
+        ]
+        with _lock:
+            for samples in _active.values():
+                samples.update(stacks)
+
+
+def enabled() -> bool:
+    return PROFILE_SLOW_REQUESTS_MS > 0
+
+
+def start_request() -> Optional[int]:
+    """Begin collecting samples for a request; returns a handle for finish_request."""
+    global _next_id, _thread
+    if not enabled():
+        return None
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_sample_loop, name="profiler", daemon=True)
+            _thread.start()
+        _next_id += 1
+        _active[_next_id] = Counter()
+        return _next_id
+
+
+def finish_request(handle: Optional[int], label: str, elapsed: float):
+    if handle is None:
+        return
+    with _lock:
+        samples = _active.pop(handle, None)
+    if not samples or elapsed * 1000 < PROFILE_SLOW_REQUESTS_MS:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms-{safe_label}.folded")
+    with open(path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    logger.info("Slow request profiled", extra={"request": label, "elapsed_ms": round(elapsed * 1000), "path": path})
@@ -0,0 +1,203 @@
+"""Admission control for the AI endpoints, as FastAPI dependencies.
+
+- RateLimit: a token bucket per client. A client is the user in a valid
+  bearer token, or the client IP for anonymous requests (run uvicorn with
+  --proxy-headers behind a reverse proxy). Each request takes one token, and
+  tokens refill at ``per_minute`` up to ``burst``. By default buckets live in
+  process memory, so every worker keeps its own. Set RATE_LIMIT_REDIS_URL to
+  share them between workers through Redis or any Redis-compatible server.
+- ConcurrencyLimit: a cap on upstream AI calls in flight in this worker.
+  As a dependency it only arms the cap for the request; the slot is taken
+  by admitted() around each call that actually goes to Gemini, so answers
+  from the database or the prompt cache are never refused.
+
+Both answer 429 with Retry-After (via RateLimited) instead of queueing,
+so admitted requests keep predictable latency.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import Request
+
+from .cache import LRUCache
+
+try:
+    import redis
+except ImportError:  # optional, only needed for RATE_LIMIT_REDIS_URL
+    redis = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AI_RATE_LIMIT_PER_MINUTE = float(os.getenv("AI_RATE_LIMIT_PER_MINUTE", "30"))
+AI_RATE_LIMIT_BURST = int(os.getenv("AI_RATE_LIMIT_BURST", "10"))
+AI_MAX_CONCURRENT_REQUESTS = int(os.getenv("AI_MAX_CONCURRENT_REQUESTS", "20"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+
+class RateLimited(Exception):
+    """The request was refused by a limiter; answered with 429."""
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class MemoryBuckets:
+    """Per-process backend: key -> (tokens, updated_at), LRU-bounded.
+
+    A bucket untouched for burst / rate seconds is full again, so that is
+    also when its entry expires. RateLimit runs in the threadpool, so the
+    read-modify-write of a bucket is done under a lock.
+    """
+
+    def __init__(self, max_clients: int):
+        self._buckets = LRUCache(maxsize=max_clients)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets.set(key, (tokens, now), ttl=burst / rate)
+        return wait
+
+
+# Same refill as MemoryBuckets, atomic on the server and timed by its clock.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Shared backend: one Redis hash per bucket (``ratelimit:<name>:<client>``)."""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the redis package is not installed")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        return float(self._take(keys=[key], args=[rate, burst]))
+
+
+def _make_backend():
+    if RATE_LIMIT_REDIS_URL:
+        return RedisBuckets(RATE_LIMIT_REDIS_URL)
+    return MemoryBuckets(RATE_LIMIT_MAX_CLIENTS)
+
+
+buckets = _make_backend()
+
+
+def client_key(request: Request, payload: Optional[dict]) -> str:
+    if payload is not None:
+        return f"user:{payload['sub']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class RateLimit:
+    """Dependency taking one token from the caller's ``name`` bucket, or raising RateLimited.
+
+    If the backend fails, requests are let through rather than refused.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: int):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.rejected = 0
+
+    def __call__(self, request: Request):
+        # Imported here: crud imports this module, and the users router imports crud.
+        from .routers.users import get_optional_token_payload
+        payload = get_optional_token_payload(request.headers.get("authorization"))
+        key = f"ratelimit:{self.name}:{client_key(request, payload)}"
+        try:
+            wait = buckets.take(key, self.rate, self.burst)
+        except Exception as e:
+            logger.warning("Rate limit check failed", extra={"limiter": self.name, "error": str(e)})
+            return
+        if wait > 0:
+            self.rejected += 1
+            raise RateLimited("Too many requests, please slow down", wait)
+
+
+class ConcurrencyLimit:
+    """At most ``limit`` upstream calls at once in this worker; over it, RateLimited is raised."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def __call__(self):
+        """Dependency: upstream calls made for this request go through this limit (see admitted())."""
+        _admission.set(self)
+
+    def acquire(self):
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            raise RateLimited("Server is busy, please try again shortly", 1.0)
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+
+
+_admission: contextvars.ContextVar[Optional[ConcurrencyLimit]] = contextvars.ContextVar("admission", default=None)
+
+
+@asynccontextmanager
+async def admitted():
+    """Hold a slot of the current request's ConcurrencyLimit, if it has one, around an upstream call.
+
+    Background work (prefetching, image lookups) runs outside any request
+    and is bounded by its own worker pools instead.
+    """
+    limit = _admission.get()
+    if limit is None:
+        yield
+        return
+    limit.acquire()
+    try:
+        yield
+    finally:
+        limit.release()
+
+
+ai_rate_limit = RateLimit("ai", AI_RATE_LIMIT_PER_MINUTE, AI_RATE_LIMIT_BURST)
+ai_concurrency = ConcurrencyLimit("ai", AI_MAX_CONCURRENT_REQUESTS)
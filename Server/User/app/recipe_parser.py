@@ -0,0 +1,239 @@
+"""Parsers for the plain-text formats we ask Gemini to answer in.
+
+All patterns are compiled once at import time and every parser makes a
+single pass over the response lines.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Recipe/video sites we prefer as a dish reference over any other link.
+ALLOWED_REFERENCE_DOMAINS = frozenset([
+    "youtube.com", "allrecipes.com", "foodnetwork.com", "tasty.co", "epicurious.com",
+    "panlasangpinoy.com", "yummly.com", "simplyrecipes.com", "bbcgoodfood.com", "tasteofhome.com",
+])
+
+# "Ingredients:", "**Steps**", "## Reference", "* **Ingredients**" ... (case-insensitive)
+_SECTION_HEADER = re.compile(r"[#*\s]*(ingredients|steps|reference)\*?\*?:?", re.IGNORECASE)
+# List markers only ("- ", "* ", "1. ", "2) "), so "1/2 cup sugar" keeps its quantity.
+_BULLET_PREFIX = re.compile(r"^(?:[-*\u2022]+\s*|\d+[.)]\s*)+")
+_URL = re.compile(r"https?://\S+")
+_URL_TRAILING_PUNCTUATION = ")]>.,;*\"'"
+# "DISH 1:", "**Dish 2**", "DISH3:"
+_DISH_HEADER = re.compile(r"[*#\s]*dish\s*(\d+)\b", re.IGNORECASE)
+# "Name: ...", "**Time:** ...", "- Difficulty: ..."
+_DISH_FIELD = re.compile(
+    r"[*\-\s]*(name|description|ingredients|time|difficulty|instructions)\**\s*:\**\s*(.*)",
+    re.IGNORECASE,
+)
+# "how to cook adobo?" -> "adobo". Order matters: more specific phrasings first.
+_DISH_REQUEST_PATTERNS = [re.compile(pattern) for pattern in (
+    r"i want to cook (.+)",
+    r"how to cook (.+)",
+    r"show me how to make (.+)",
+    r"how do i make (.+)",
+    r"give me the recipe for (.+)",
+    r"recipe for (.+)",
+    r"how to make (.+)",
+    r"make (.+)",
+)]
+
+# Leading quantity of an ingredient line: "2", "1.5", "1/2", "1 1/2", "2-3", "1½", "½"
+_QUANTITY = re.compile(
+    r"(\d+\s+\d+/\d+|\d+/\d+|\d*[\u00bc-\u00be\u2150-\u215e]|\d+(?:\.\d+)?(?:\s*-\s*\d+(?:\.\d+)?)?)\s*"
+)
+_PARENTHESIZED = re.compile(r"\([^)]*\)")
+INGREDIENT_UNITS = frozenset([
+    "bunch", "bunches", "can", "cans", "clove", "cloves", "cup", "cups", "dash", "g", "gram", "grams",
+    "head", "heads", "kg", "kilo", "kilos", "l", "lb", "lbs", "liter", "liters", "litre", "litres",
+    "ml", "oz", "ounce", "ounces", "packet", "packets", "pack", "packs", "pc", "pcs", "piece", "pieces",
+    "pinch", "pound", "pounds", "slice", "slices", "sprig", "sprigs", "stalk", "stalks", "tbsp", "tbs",
+    "tablespoon", "tablespoons", "thumb", "thumbs", "tsp", "teaspoon", "teaspoons",
+])
+
+
+def _is_allowed_domain(url: str) -> bool:
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return False
+    if not host:
+        return False
+    # Check the host and each parent domain: m.youtube.com -> youtube.com -> com
+    while True:
+        if host in ALLOWED_REFERENCE_DOMAINS:
+            return True
+        dot = host.find(".")
+        if dot == -1:
+            return False
+        host = host[dot + 1:]
+
+
+def _find_urls(line: str) -> List[str]:
+    return [url.rstrip(_URL_TRAILING_PUNCTUATION) for url in _URL.findall(line)]
+
+
+def _preferred_url(urls: List[str]) -> Optional[str]:
+    for url in urls:
+        if _is_allowed_domain(url):
+            return url
+    return None
+
+
+def parse_recipe(response: str) -> Tuple[List[str], List[str], str]:
+    """Parse an ``Ingredients:/Steps:/Reference:`` response into (ingredients, steps, reference)."""
+    ingredients, steps, reference = [], [], ""
+    section = None
+    for line in response.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        header = _SECTION_HEADER.match(line)
+        if header:
+            section = header.group(1).lower()
+            if section == "reference":
+                urls = _find_urls(line)
+                reference = _preferred_url(urls) or (urls[0] if urls else line.split(":", 1)[-1].strip())
+            continue
+        first = line[0]
+        if section == "ingredients" or section == "steps":
+            if first == "-" or first == "*" or first.isdigit():
+                item = _BULLET_PREFIX.sub("", line)
+                if item:
+                    (ingredients if section == "ingredients" else steps).append(item)
+        elif section == "reference":
+            urls = _find_urls(line)
+            preferred = _preferred_url(urls)
+            if preferred:
+                reference = preferred
+            elif not reference:
+                reference = urls[0] if urls else line
+    return ingredients, steps, reference
+
+
+def parse_ingredient(text: str) -> Dict[str, Optional[str]]:
+    """Split an ingredient line into its display text, name, quantity and unit.
+
+    ``"1/2 cup soy sauce"`` -> ``{"text": "1/2 cup soy sauce", "name": "soy sauce",
+    "quantity": "1/2", "unit": "cup"}``. The name is lowercased and drops
+    preparation notes ("pork belly, cubed" -> "pork belly") so it can be
+    matched across recipes.
+    """
+    text = text.strip()
+    rest = text
+    quantity = unit = None
+    match = _QUANTITY.match(rest)
+    if match:
+        quantity = match.group(1)
+        rest = rest[match.end():]
+        word, _, remainder = rest.partition(" ")
+        if word.rstrip(".").lower() in INGREDIENT_UNITS:
+            unit = word.rstrip(".").lower()
+            rest = remainder
+    name = _PARENTHESIZED.sub("", rest).split(",", 1)[0]
+    name = " ".join(name.lower().split())
+    if name.startswith("of "):
+        name = name[3:]
+    return {"text": text, "name": name, "quantity": quantity, "unit": unit}
+
+
+def parse_dishes(response: str) -> List[Dict[str, str]]:
+    """Parse the multi-dish ``DISH n:`` format used by ai_conversation.
+
+    Each dish becomes a dict with any of the keys name, description,
+    ingredients, time, difficulty and instructions. Numbered instruction
+    lines following ``Instructions:`` are kept, one step per line.
+    """
+    dishes = []
+    current = {}
+    field = None
+    for line in response.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        if _DISH_HEADER.match(line):
+            if current:
+                dishes.append(current)
+            current = {}
+            field = None
+            continue
+        match = _DISH_FIELD.match(line)
+        if match:
+            field = match.group(1).lower()
+            current[field] = match.group(2).strip()
+        elif field == "instructions":
+            current[field] = f"{current[field]}\n{line}" if current[field] else line
+    if current:
+        dishes.append(current)
+    return dishes
+
+
+class DishStreamParser:
+    """parse_dishes for a response that arrives in chunks.
+
+    feed() returns the dishes whose block ended in that chunk (a block ends
+    where the next ``DISH n:`` header starts), and close() returns the rest.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        self._block: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, str]]:
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        dishes = []
+        for line in lines:
+            if self._block and _DISH_HEADER.match(line.strip()):
+                dishes.extend(parse_dishes("\n".join(self._block)))
+                self._block = []
+            self._block.append(line)
+        return dishes
+
+    def close(self) -> List[Dict[str, str]]:
+        dishes = self.feed("\n")
+        dishes.extend(parse_dishes("\n".join(self._block)))
+        self._block = []
+        return dishes
+
+
+def parse_recipe_batch(response: str) -> Dict[int, Tuple[List[str], List[str], str]]:
+    """Parse several ``Ingredients:/Steps:/Reference:`` recipes, each under a ``DISH n:`` header.
+
+    Returns {n: (ingredients, steps, reference)}; dishes the response skipped are absent.
+    """
+    chunks: Dict[int, List[str]] = {}
+    current = None
+    for line in response.split("\n"):
+        header = _DISH_HEADER.match(line)
+        if header:
+            current = chunks.setdefault(int(header.group(1)), [])
+        elif current is not None:
+            current.append(line)
+    return {number: parse_recipe("\n".join(lines)) for number, lines in chunks.items()}
+
+
+def parse_dish_names(response: str) -> List[str]:
+    """Parse a numbered or bulleted list of dish names (ai_dishes)."""
+    dishes = []
+    lines = [line.strip() for line in response.split("\n")]
+    for line in lines:
+        if line and (line[0].isdigit() or line[0] == "-"):
+            # Remove number or dash
+            name = line.split(".", 1)[-1].strip() if "." in line else line.lstrip("-").strip()
+            if name:
+                dishes.append(name)
+    if not dishes:
+        # fallback: just split lines
+        dishes = [line for line in lines if line]
+    return dishes
+
+
+def extract_requested_dish(user_input: str) -> Optional[str]:
+    """Return the dish name if the user is asking for one specific dish, else None."""
+    text = user_input.strip().lower()
+    for pattern in _DISH_REQUEST_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            return match.group(1).strip().rstrip("?.!")
+    return None
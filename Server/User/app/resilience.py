@@ -0,0 +1,266 @@
+"""Circuit breakers, retries and deadlines for calls to external APIs.
+
+Each upstream (Gemini, Openverse) has an Upstream that wraps every call:
+
+- Circuit breaker: after UPSTREAM_FAILURE_THRESHOLD consecutive failures,
+  calls fail at once with UpstreamUnavailable for UPSTREAM_RESET_SECONDS.
+  After that, a single trial call decides whether to close the breaker
+  again. Callers can fall back to stale data, or answer 503 with
+  Retry-After.
+- Retries: timeouts, connection errors, 429 and 5xx are retried up to
+  UPSTREAM_MAX_ATTEMPTS times, with full-jitter exponential backoff. A retry
+  budget caps retries at UPSTREAM_RETRY_BUDGET_RATIO of calls, plus a small
+  reserve, so an outage doesn't multiply the load on the upstream.
+- Deadlines: DeadlineMiddleware gives each request REQUEST_TIMEOUT_SECONDS
+  (or less, if the client sends X-Request-Timeout, but never less than
+  REQUEST_TIMEOUT_MIN_SECONDS). Attempts and backoff sleeps are cut to the
+  time remaining, and no attempt starts once it has run out. Timeouts of
+  attempts the deadline cut short don't count against the breaker.
+"""
+import asyncio
+import contextvars
+import math
+import os
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "5"))
+UPSTREAM_RESET_SECONDS = float(os.getenv("UPSTREAM_RESET_SECONDS", "30"))
+UPSTREAM_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "3"))
+UPSTREAM_BACKOFF_BASE_MS = float(os.getenv("UPSTREAM_BACKOFF_BASE_MS", "200"))
+UPSTREAM_RETRY_BUDGET_RATIO = float(os.getenv("UPSTREAM_RETRY_BUDGET_RATIO", "0.2"))
+# Retries allowed beyond the ratio, so a quiet worker can still retry.
+UPSTREAM_RETRY_BUDGET_RESERVE = 10
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "30"))
+# Floor for X-Request-Timeout, so clients can't make every call time out.
+REQUEST_TIMEOUT_MIN_SECONDS = float(os.getenv("REQUEST_TIMEOUT_MIN_SECONDS", "1"))
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class UpstreamError(Exception):
+    """An upstream answered with an error status."""
+
+    def __init__(self, status: int, body: str = ""):
+        super().__init__(f"upstream returned {status}")
+        self.status = status
+        self.body = body
+
+
+class UpstreamUnavailable(Exception):
+    """The call was not attempted: the breaker is open or the request's deadline has passed."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, UpstreamError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None outside a request."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = UPSTREAM_FAILURE_THRESHOLD,
+                 reset_seconds: float = UPSTREAM_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.opened = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; while half-open only the one trial call may."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            # A trial that never reported back (e.g. cancelled) is replaced after the same wait.
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        if self.state == OPEN:
+            return max(self.reset_seconds - (time.monotonic() - self._opened_at), 1.0)
+        return 1.0
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self._failures = 0
+
+    def release_trial(self):
+        """Forget an abandoned half-open trial so the next call can be the trial."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self._opened_at = time.monotonic() - self.reset_seconds
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Each call earns ``ratio`` of a retry; retries spend whole ones (at most ``reserve`` saved up)."""
+
+    def __init__(self, ratio: float = UPSTREAM_RETRY_BUDGET_RATIO, reserve: int = UPSTREAM_RETRY_BUDGET_RESERVE):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._balance = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self._balance + self.ratio, self.reserve)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class Upstream:
+    def __init__(self, name: str, timeout: float, max_attempts: int = UPSTREAM_MAX_ATTEMPTS):
+        self.name = name
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.breaker = CircuitBreaker()
+        self.budget = RetryBudget()
+        self.calls = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def check(self):
+        """Raise UpstreamUnavailable unless a call may go out now (for calls made without call())."""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable(self.name, self.breaker.retry_after())
+
+    def record(self, error: Optional[BaseException] = None, timeout: Optional[float] = None):
+        """Report the outcome of a call made after check() with ``timeout``.
+
+        Only errors from the upstream or the HTTP client say anything about
+        the upstream: transient ones count as failures, the rest (e.g. 4xx)
+        still prove it is up. Anything else, such as the caller going away,
+        is neutral, and so is a timeout shorter than the upstream's own
+        (the request's deadline cut it short).
+        """
+        if error is None:
+            self.breaker.record_success()
+        elif not isinstance(error, (UpstreamError, httpx.HTTPError)):
+            self.breaker.release_trial()
+        elif isinstance(error, httpx.TimeoutException) and timeout is not None and timeout < self.timeout:
+            self.breaker.release_trial()
+        elif is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def attempt_timeout(self) -> float:
+        """This upstream's timeout cut to the request's remaining time; raises UpstreamUnavailable once none is left."""
+        left = remaining()
+        if left is None:
+            return self.timeout
+        if left <= 0:
+            self.rejected += 1
+            raise UpstreamUnavailable(self.name, 1.0)
+        return min(self.timeout, left)
+
+    async def call(self, attempt: Callable[[float], Awaitable[T]]) -> T:
+        """Run ``attempt(timeout)``, retrying transient failures within the budget and deadline."""
+        # Running out of time before an attempt says nothing about the upstream,
+        # so the deadline is checked outside the try and never recorded.
+        timeout = self.attempt_timeout()
+        self.check()
+        self.calls += 1
+        self.budget.deposit()
+        for number in range(1, self.max_attempts + 1):
+            if number > 1:
+                try:
+                    timeout = self.attempt_timeout()
+                except UpstreamUnavailable:
+                    self.breaker.release_trial()
+                    raise
+            try:
+                result = await attempt(timeout)
+            except Exception as e:
+                self.record(e, timeout)
+                if number == self.max_attempts or not is_retryable(e):
+                    raise
+                if not self.breaker.allow():
+                    raise UpstreamUnavailable(self.name, self.breaker.retry_after()) from e
+                if not self.budget.withdraw():
+                    raise
+                delay = random.uniform(0, UPSTREAM_BACKOFF_BASE_MS / 1000 * 2 ** (number - 1))
+                left = remaining()
+                if left is not None and delay >= left:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(delay)
+            except BaseException as e:
+                # Cancelled: neutral, but don't keep a half-open trial.
+                self.record(e)
+                raise
+            else:
+                self.record()
+                return result
+
+
+class DeadlineMiddleware:
+    """ASGI middleware setting the deadline that upstream calls made for a request must meet."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        budget = REQUEST_TIMEOUT_SECONDS
+        for name, value in scope["headers"]:
+            if name == b"x-request-timeout":
+                try:
+                    budget = min(budget, max(float(value), REQUEST_TIMEOUT_MIN_SECONDS))
+                except ValueError:
+                    pass
+                break
+        token = _deadline.set(time.monotonic() + budget)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
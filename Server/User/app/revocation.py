@@ -0,0 +1,152 @@
+"""Server-side JWT revocation for /logout.
+
+Revoked ``jti``s are stored in revoked_tokens with their expiry. Each worker
+mirrors the unexpired ones in memory: a Bloom filter answers "definitely not
+revoked" for almost every token, and only filter hits are confirmed against
+the exact set. A background task pulls rows revoked since the last refresh,
+so a logout on one worker reaches the others within
+REVOCATION_REFRESH_SECONDS.
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from uuid import UUID
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .database import AsyncSessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "5"))
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+# Re-read this far behind the newest revoked_at seen, so rows from
+# transactions that committed out of order are not missed.
+_REFRESH_OVERLAP = timedelta(seconds=30)
+# Delete expired rows from the table every this many refreshes.
+_PRUNE_EVERY = 100
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float = REVOCATION_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationList:
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY):
+        self._lock = threading.Lock()
+        self._capacity = capacity
+        self._bloom = BloomFilter(capacity)
+        self._revoked: Dict[str, datetime] = {}
+        self._since: Optional[datetime] = None
+        self._refreshes = 0
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def is_revoked(self, jti: str) -> bool:
+        if jti not in self._bloom:
+            return False
+        return jti in self._revoked
+
+    def _add(self, jti: str, expires_at: datetime):
+        if jti in self._revoked:
+            return
+        self._revoked[jti] = expires_at
+        self._bloom.add(jti)
+
+    def _rebuild(self, now: datetime):
+        """Drop expired entries and rebuild the filter (it can't delete), growing it if needed."""
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        while len(self._revoked) > self._capacity // 2:
+            self._capacity *= 2
+        bloom = BloomFilter(self._capacity)
+        for jti in self._revoked:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    async def revoke(self, db: AsyncSession, jti: str, expires_at: datetime, user_id: Optional[UUID] = None):
+        """Persist a revocation and apply it to this worker immediately."""
+        await db.execute(
+            pg_insert(models.RevokedToken)
+            .values(jti=jti, user_id=user_id, expires_at=expires_at)
+            .on_conflict_do_nothing(index_elements=["jti"])
+        )
+        await db.commit()
+        with self._lock:
+            self._add(jti, expires_at)
+
+    async def refresh(self, db: AsyncSession):
+        """Load revocations made since the last refresh (everything unexpired on the first call)."""
+        now = datetime.utcnow()
+        query = select(
+            models.RevokedToken.jti, models.RevokedToken.expires_at, models.RevokedToken.revoked_at
+        ).where(models.RevokedToken.expires_at > now)
+        if self._since is not None:
+            query = query.where(models.RevokedToken.revoked_at >= self._since - _REFRESH_OVERLAP)
+        rows = (await db.execute(query)).all()
+        if self._since is None and not rows:
+            # Nothing revoked yet: later refreshes start from the database clock.
+            self._since = await db.scalar(select(func.timezone("utc", func.now())))
+
+        with self._lock:
+            for jti, expires_at, revoked_at in rows:
+                self._add(jti, expires_at)
+                if self._since is None or revoked_at > self._since:
+                    self._since = revoked_at
+            self._refreshes += 1
+            prune = self._refreshes % _PRUNE_EVERY == 0
+            if prune or len(self._revoked) > self._capacity:
+                self._rebuild(now)
+
+        if prune:
+            await db.execute(delete(models.RevokedToken).where(models.RevokedToken.expires_at <= now))
+            await db.commit()
+
+
+revocations = RevocationList()
+
+
+async def run_refresh():
+    try:
+        started = time.perf_counter()
+        first = revocations._since is None
+        async with AsyncSessionLocal() as db:
+            await revocations.refresh(db)
+        if first:
+            logger.info("Loaded revoked tokens", extra={
+                "count": len(revocations), "elapsed_ms": round((time.perf_counter() - started) * 1000)})
+    except Exception:
+        logger.exception("Revocation refresh failed")
@@ -1,54 +1,85 @@
 from fastapi import APIRouter, Depends, HTTPException, Body, Query
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-from typing import List
-import re
+from typing import AsyncIterator, List, Literal, Optional
+import asyncio
+import json
+import logging
+import os
 
-from .. import models, schemas, crud
-from ..database import SessionLocal
+from .. import models, schemas, crud, recipe_parser, pantry_index, resilience, ratelimit
+from ..database import AsyncSessionLocal
+from ..singleflight import SingleFlight
+from ..prefetch import Prefetcher
 from app.routers.users import get_current_user, get_db
 
 router = APIRouter(prefix="/api/lutome/recipes", tags=["recipes"])
+logger = logging.getLogger(__name__)
+
+# How long identical prompts are answered from the prompt cache, in seconds.
+AI_DISHES_CACHE_TTL = float(os.getenv("AI_DISHES_CACHE_TTL", "86400"))
+AI_INGREDIENTS_CACHE_TTL = float(os.getenv("AI_INGREDIENTS_CACHE_TTL", "86400"))
+AI_SUGGEST_CACHE_TTL = float(os.getenv("AI_SUGGEST_CACHE_TTL", "3600"))
+AI_CONVERSATION_CACHE_TTL = float(os.getenv("AI_CONVERSATION_CACHE_TTL", "3600"))
+
+# Background generation of recipe details for dishes listed by ai_dishes?prefetch=true.
+AI_PREFETCH_WORKERS = int(os.getenv("AI_PREFETCH_WORKERS", "2"))
+AI_PREFETCH_MAX_PENDING = int(os.getenv("AI_PREFETCH_MAX_PENDING", "100"))
+# ai_ingredients_batch: dishes accepted per request, and packed into one Gemini prompt.
+AI_BATCH_MAX_DISHES = int(os.getenv("AI_BATCH_MAX_DISHES", "20"))
+AI_BATCH_DISHES_PER_PROMPT = int(os.getenv("AI_BATCH_DISHES_PER_PROMPT", "5"))
+
+# Concurrent requests for the same uncached dish share one Gemini call and one insert.
+recipe_flights = SingleFlight()
+recipe_prefetcher = Prefetcher(AI_PREFETCH_WORKERS, AI_PREFETCH_MAX_PENDING)
+
+# Endpoints that may call Gemini share one rate-limit bucket per client; their Gemini calls share one concurrency cap.
+AI_ADMISSION = [Depends(ratelimit.ai_rate_limit), Depends(ratelimit.ai_concurrency)]
 
 # AI endpoints FIRST
-@router.get("/ai_dishes")
-def ai_dishes(category: str = Query(None, description="Food category")):
-    print(f"[ai_dishes] Received category: {category!r}")
+@router.get("/ai_dishes", dependencies=AI_ADMISSION)
+async def ai_dishes(
+    category: str = Query(None, description="Food category"),
+    prefetch: bool = Query(False, description="Generate the listed dishes' recipes in the background"),
+    db: AsyncSession = Depends(get_db),
+):
+    logger.debug("ai_dishes", extra={"category": category})
     if not category or not category.strip():
         raise HTTPException(status_code=400, detail="Category is required")
     prompt = f"Give me a list of 10 popular dishes or recipes for the category '{category}'. Only return the dish names as a numbered list."
-    response = crud.call_gemini_api(prompt)
+    response = await crud.call_gemini_api(prompt, cache_ttl=AI_DISHES_CACHE_TTL)
     if not response:
         raise HTTPException(status_code=500, detail="AI service unavailable or error.")
-    # Parse Gemini's response into a list
-    dishes = []
-    for line in response.split('\n'):
-        line = line.strip()
-        if line and (line[0].isdigit() or line.startswith('-')):
-            # Remove number or dash
-            name = line.split('.', 1)[-1].strip() if '.' in line else line.lstrip('-').strip()
-            if name:
-                dishes.append(name)
-    if not dishes:
-        # fallback: just split lines
-        dishes = [l.strip() for l in response.split('\n') if l.strip()]
+    dishes = recipe_parser.parse_dish_names(response)
+    if prefetch and dishes:
+        await _prefetch_recipes(db, dishes)
     return {"dishes": dishes}
 
-@router.get("/ai_ingredients")
-def ai_ingredients(dish: str = Query(None, description="Dish name"), db: Session = Depends(get_db)):
-    print(f"[ai_ingredients] Received dish: {dish!r}")
-    if not dish or not dish.strip():
-        raise HTTPException(status_code=400, detail="Dish is required")
-    # 1. Check if recipe is already cached in DB
-    db_recipe = db.query(models.Recipe).filter(models.Recipe.title.ilike(dish)).first()
-    if db_recipe and db_recipe.ingredients and db_recipe.steps:
-        return {
-            "ingredients": db_recipe.ingredients.split('\n'),
-            "steps": db_recipe.steps.split('\n'),
-            "reference": getattr(db_recipe, 'reference', '')
-        }
-    # 2. If not, call Gemini
-    prompt = (
+async def _prefetch_recipes(db: AsyncSession, dishes: List[str]):
+    """Queue detail generation for listed dishes not yet stored, top of the list first."""
+    cached = await crud.get_cached_recipes(db, dishes)
+    for rank, dish in enumerate(dishes):
+        key = crud.normalize_title(dish)
+        if key in cached or recipe_flights.in_flight(key):
+            continue
+        # Through recipe_flights, so a tap on a dish being prefetched waits for the same call.
+        recipe_prefetcher.submit(rank, key, recipe_flights.do, key, _generate_recipe, dish)
+
+async def _with_session(fn, *args):
+    """Run a crud function with its own short-lived session (for work shared between requests)."""
+    async with AsyncSessionLocal() as db:
+        return await fn(db, *args)
+
+def _recipe_details(recipe: models.Recipe) -> dict:
+    return {
+        "ingredients": crud.recipe_ingredients(recipe),
+        "steps": crud.recipe_steps(recipe),
+        "reference": recipe.reference or ''
+    }
+
+def _recipe_prompt(dish: str) -> str:
+    return (
         f"For the dish '{dish}', provide:\n"
         f"1. A bullet list of main ingredients.\n"
         f"2. Step-by-step instructions on how to cook it.\n"
@@ -56,222 +87,178 @@ def ai_ingredients(dish: str = Query(None, description="Dish name"), db: Session
         f"Format:\n"
         f"Ingredients:\n- ...\nSteps:\n1. ...\nReference: https://youtube.com/watch?v=... or https://allrecipes.com/recipe/..."
     )
-    response = crud.call_gemini_api(prompt)
+
+async def _generate_recipe(dish: str) -> dict:
+    # An earlier flight for this dish may have finished after the caller's cache check.
+    db_recipe = await _with_session(crud.get_recipe_by_title, dish)
+    if db_recipe and db_recipe.ingredients and db_recipe.steps:
+        return _recipe_details(db_recipe)
+    response = await crud.call_gemini_api(_recipe_prompt(dish), cache_ttl=AI_INGREDIENTS_CACHE_TTL)
     if not response:
         raise HTTPException(status_code=500, detail="AI service unavailable or error.")
-
-    # Parse Gemini's response
-    ingredients, steps, reference = [], [], ""
-    section = None
-    for line in response.split('\n'):
-        line = line.strip()
-        # Robust section detection (handles Markdown, colons, etc.)
-        if re.match(r"^\*?\*?ingredients\*?\*?:?", line.lower()):
-            section = "ingredients"
-            continue
-        if re.match(r"^\*?\*?steps\*?\*?:?", line.lower()):
-            section = "steps"
-            continue
-        if re.match(r"^\*?\*?reference\*?\*?:?", line.lower()):
-            section = "reference"
-            # Try to extract a known recipe/video site URL
-            allowed_domains = ["youtube.com", "allrecipes.com", "foodnetwork.com", "tasty.co", "epicurious.com", "panlasangpinoy.com", "yummly.com", "simplyrecipes.com", "bbcgoodfood.com", "tasteofhome.com"]
-            urls = re.findall(r"https?://\S+", line)
-            found = False
-            for url in urls:
-                for domain in allowed_domains:
-                    if domain in url:
-                        reference = url
-                        found = True
-                        break
-                if found:
-                    break
-            if not found:
-                # fallback: any url
-                if urls:
-                    reference = urls[0]
-                else:
-                    reference = line.split(":", 1)[-1].strip()
-            continue
-        elif section == "reference" and line.strip():
-            urls = re.findall(r"https?://\S+", line)
-            found = False
-            for url in urls:
-                for domain in allowed_domains:
-                    if domain in url:
-                        reference = url
-                        found = True
-                        break
-                if found:
-                    break
-            if not found and not reference:
-                if urls:
-                    reference = urls[0]
-                else:
-                    reference = line.strip()
-        if section == "ingredients" and (line.startswith("-") or line.startswith("*") or line[:1].isdigit()):
-            # Remove bullet, number, or asterisk
-            name = re.sub(r"^[\-*\d.\s]+", "", line)
-            if name:
-                ingredients.append(name)
-        elif section == "steps" and (line[:1].isdigit() or line.startswith("-") or line.startswith("*")):
-            step = re.sub(r"^[\-*\d.\s]+", "", line)
-            if step:
-                steps.append(step)
-
+    ingredients, steps, reference = recipe_parser.parse_recipe(response)
     # Save to DB for future use
-    db_recipe = models.Recipe(
-        title=dish,
-        ingredients='\n'.join(ingredients),
-        steps='\n'.join(steps),
-        reference=reference,
-        image_url=None,
-        tags=[],
-        difficulty=None,
-        estimated_time=None,
-        created_by=None
-    )
-    db.add(db_recipe)
-    db.commit()
-    db.refresh(db_recipe)
-
+    await _with_session(crud.save_ai_recipe, dish, ingredients, steps, reference)
     return {
         "ingredients": ingredients,
         "steps": steps,
         "reference": reference
     }
 
-@router.post("/ai_suggest")
-def ai_suggest(prompt: str = Body(..., embed=True)):
-    response = crud.call_gemini_api(prompt)
+def _recipe_batch_prompt(dishes: List[str]) -> str:
+    listing = "\n".join(f"DISH {number}: {dish}" for number, dish in enumerate(dishes, 1))
+    return (
+        f"For each of the following dishes, provide:\n"
+        f"1. A bullet list of main ingredients.\n"
+        f"2. Step-by-step instructions on how to cook it.\n"
+        f"3. A YouTube video link or recipe website link for this dish.\n"
+        f"{listing}\n"
+        f"Answer for every dish, in the same order, using its DISH number as a header.\n"
+        f"Format:\n"
+        f"DISH 1: [Dish Name]\nIngredients:\n- ...\nSteps:\n1. ...\nReference: https://youtube.com/watch?v=... or https://allrecipes.com/recipe/...\n\n"
+        f"DISH 2: [Dish Name]\n..."
+    )
+
+async def _generate_recipe_group(dishes: List[str]) -> list:
+    """One Gemini call for several dishes; returns the parsed (dish, ingredients, steps, reference) it answered."""
+    try:
+        response = await crud.call_gemini_api(_recipe_batch_prompt(dishes), cache_ttl=AI_INGREDIENTS_CACHE_TTL)
+    except (resilience.UpstreamUnavailable, ratelimit.RateLimited):
+        # Reported per dish by the single-dish fallback, so cached dishes are still returned.
+        return []
     if not response:
-        raise HTTPException(status_code=500, detail="AI service unavailable or error.")
-    return {"suggestion": response}
+        return []
+    parsed = recipe_parser.parse_recipe_batch(response)
+    generated = []
+    for number, dish in enumerate(dishes, 1):
+        ingredients, steps, reference = parsed.get(number, ([], [], ""))
+        if ingredients and steps:
+            generated.append((dish, ingredients, steps, reference))
+    return generated
 
+async def generate_recipes(db: AsyncSession, dishes: List[str]) -> dict:
+    """Recipe details for several dishes, keyed by normalized title.
 
-@router.post("/ai_conversation")
-def ai_conversation(user_input: str = Body(..., embed=True), db: Session = Depends(get_db)):
-    print(f"[ai_conversation] User input: {user_input!r}")
+    Stored dishes are read from the database. The rest are packed
+    AI_BATCH_DISHES_PER_PROMPT to a Gemini prompt, and the prompts run
+    concurrently. Everything generated is inserted in one transaction.
+    Dishes a batch answer left out fall back to a single-dish call. Dishes
+    that still fail are missing from the result.
+    """
+    wanted = {}
+    for dish in dishes:
+        wanted.setdefault(crud.normalize_title(dish), dish)
+    cached = await crud.get_cached_recipes(db, list(wanted.values()))
+    results = {key: _recipe_details(recipe) for key, recipe in cached.items()}
 
-    # Try to detect if the user is asking for a specific dish
-    dish_patterns = [
-        r"i want to cook (.+)",
-        r"how to cook (.+)",
-        r"show me how to make (.+)",
-        r"how do i make (.+)",
-        r"give me the recipe for (.+)",
-        r"recipe for (.+)",
-        r"how to make (.+)",
-        r"make (.+)",
-    ]
-    dish_name = None
-    for pat in dish_patterns:
-        m = re.match(pat, user_input.strip().lower())
-        if m:
-            dish_name = m.group(1).strip().rstrip("?.!")
-            break
+    # Dishes already being generated for another request join that call.
+    missing = [dish for key, dish in wanted.items() if key not in results and not recipe_flights.in_flight(key)]
+    joining = [dish for key, dish in wanted.items() if key not in results and recipe_flights.in_flight(key)]
+    groups = [missing[i:i + AI_BATCH_DISHES_PER_PROMPT] for i in range(0, len(missing), AI_BATCH_DISHES_PER_PROMPT)]
+    generated = [item for group in await asyncio.gather(*map(_generate_recipe_group, groups)) for item in group]
+    if generated:
+        for recipe in await crud.save_ai_recipes(db, generated):
+            results[recipe.title_key] = _recipe_details(recipe)
 
-    if dish_name:
-        # Only return the specific dish as the suggestion
-        # Call the AI for details about this dish (reuse ai_ingredients logic)
-        # Try DB first
-        db_recipe = db.query(models.Recipe).filter(models.Recipe.title.ilike(dish_name)).first()
-        if db_recipe and db_recipe.ingredients and db_recipe.steps:
-            suggestion = {
-                "name": db_recipe.title,
-                "description": db_recipe.description if hasattr(db_recipe, 'description') else '',
-                "ingredients": db_recipe.ingredients.replace('\n', ', '),
-                "time": db_recipe.estimated_time or '',
-                "difficulty": db_recipe.difficulty or '',
-                "instructions": db_recipe.steps.replace('\n', '\n'),
-                "reference": getattr(db_recipe, 'reference', ''),
-            }
+    answered = {crud.normalize_title(dish) for dish, _, _, _ in generated}
+    retry = joining + [dish for dish in missing if crud.normalize_title(dish) not in answered]
+    outcomes = await asyncio.gather(
+        *(recipe_flights.do(crud.normalize_title(dish), _generate_recipe, dish) for dish in retry),
+        return_exceptions=True,
+    )
+    for dish, outcome in zip(retry, outcomes):
+        if not isinstance(outcome, BaseException):
+            results[crud.normalize_title(dish)] = outcome
+    return results
+
+@router.post("/ai_ingredients_batch", dependencies=AI_ADMISSION)
+async def ai_ingredients_batch(dishes: List[str] = Body(..., embed=True), db: AsyncSession = Depends(get_db)):
+    """ai_ingredients for several dishes, generating the uncached ones in as few Gemini calls as possible."""
+    dishes = [dish.strip() for dish in dishes if dish and dish.strip()]
+    if not dishes:
+        raise HTTPException(status_code=400, detail="At least one dish is required")
+    if len(dishes) > AI_BATCH_MAX_DISHES:
+        raise HTTPException(status_code=400, detail=f"At most {AI_BATCH_MAX_DISHES} dishes per request")
+    results = await generate_recipes(db, dishes)
+    recipes, failed = {}, []
+    for dish in dishes:
+        details = results.get(crud.normalize_title(dish))
+        if details is None:
+            failed.append(dish)
         else:
-            # Call Gemini for this dish
-            prompt = (
-                f"For the dish '{dish_name}', provide:\n"
-                f"1. A bullet list of main ingredients.\n"
-                f"2. Step-by-step instructions on how to cook it.\n"
-                f"3. A YouTube video link or recipe website link for this dish.\n"
-                f"Format:\n"
-                f"Ingredients:\n- ...\nSteps:\n1. ...\nReference: https://youtube.com/watch?v=... or https://allrecipes.com/recipe/..."
-            )
-            response = crud.call_gemini_api(prompt)
-            if not response:
-                raise HTTPException(status_code=500, detail="AI service unavailable or error.")
-            # Parse Gemini's response
-            ingredients, steps, reference = [], [], ""
-            section = None
-            for line in response.split('\n'):
-                line = line.strip()
-                if re.match(r"^\*?\*?ingredients\*?\*?:?", line.lower()):
-                    section = "ingredients"
-                    continue
-                if re.match(r"^\*?\*?steps\*?\*?:?", line.lower()):
-                    section = "steps"
-                    continue
-                if re.match(r"^\*?\*?reference\*?\*?:?", line.lower()):
-                    section = "reference"
-                    # Try to extract a known recipe/video site URL
-                    allowed_domains = ["youtube.com", "allrecipes.com", "foodnetwork.com", "tasty.co", "epicurious.com", "panlasangpinoy.com", "yummly.com", "simplyrecipes.com", "bbcgoodfood.com", "tasteofhome.com"]
-                    urls = re.findall(r"https?://\S+", line)
-                    found = False
-                    for url in urls:
-                        for domain in allowed_domains:
-                            if domain in url:
-                                reference = url
-                                found = True
-                                break
-                        if found:
-                            break
-                    if not found:
-                        # fallback: any url
-                        if urls:
-                            reference = urls[0]
-                        else:
-                            reference = line.split(":", 1)[-1].strip()
-                    continue
-                elif section == "reference" and line.strip():
-                    urls = re.findall(r"https?://\S+", line)
-                    found = False
-                    for url in urls:
-                        for domain in allowed_domains:
-                            if domain in url:
-                                reference = url
-                                found = True
-                                break
-                        if found:
-                            break
-                    if not found and not reference:
-                        if urls:
-                            reference = urls[0]
-                        else:
-                            reference = line.strip()
-                if section == "ingredients" and (line.startswith("-") or line.startswith("*") or line[:1].isdigit()):
-                    name = re.sub(r"^[\-*\d.\s]+", "", line)
-                    if name:
-                        ingredients.append(name)
-                elif section == "steps" and (line[:1].isdigit() or line.startswith("-") or line.startswith("*")):
-                    step = re.sub(r"^[\-*\d.\s]+", "", line)
-                    if step:
-                        steps.append(step)
-            suggestion = {
-                "name": dish_name,
-                "description": f"Recipe for {dish_name}",
-                "ingredients": ', '.join(ingredients),
-                "time": '',
-                "difficulty": '',
-                "instructions": '\n'.join(steps),
-                "reference": reference,
-            }
+            recipes[dish] = details
+    return {"recipes": recipes, "failed": failed}
+
+@router.get("/ai_ingredients", dependencies=AI_ADMISSION)
+async def ai_ingredients(dish: str = Query(None, description="Dish name"), db: AsyncSession = Depends(get_db)):
+    logger.debug("ai_ingredients", extra={"dish": dish})
+    if not dish or not dish.strip():
+        raise HTTPException(status_code=400, detail="Dish is required")
+    # 1. Check if recipe is already cached in DB
+    db_recipe = await crud.get_recipe_by_title(db, dish)
+    if db_recipe and db_recipe.ingredients and db_recipe.steps:
         return {
-            "user_input": user_input,
-            "suggestions": [suggestion],
-            "ai_response": f"Direct dish request for: {dish_name}"
+            "ingredients": crud.recipe_ingredients(db_recipe),
+            "steps": crud.recipe_steps(db_recipe),
+            "reference": getattr(db_recipe, 'reference', '')
         }
+    # 2. If not, call Gemini (concurrent requests for the same dish share one call)
+    return await recipe_flights.do(crud.normalize_title(dish), _generate_recipe, dish)
 
-    # Otherwise, use the normal AI multi-suggestion logic
-    prompt = f"""
+STREAM_MEDIA_TYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+def _stream_frame(event: dict, fmt: str) -> str:
+    data = json.dumps(event)
+    if fmt == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return f"{data}\n"
+
+async def _stream_response(events: AsyncIterator[dict], fmt: str) -> StreamingResponse:
+    """Send ``events`` as server-sent events or NDJSON, ending with an error event if generation fails.
+
+    The first event is awaited before answering, so a request refused or
+    failing before anything was generated gets a proper status (429, 503, 500).
+    """
+    try:
+        first = await events.__anext__()
+    except (ratelimit.RateLimited, resilience.UpstreamUnavailable):
+        raise
+    except Exception as e:
+        logger.warning("AI stream failed", extra={"error": str(e)})
+        raise HTTPException(status_code=500, detail="AI service unavailable or error.")
+
+    async def body():
+        try:
+            yield _stream_frame(first, fmt)
+            async for event in events:
+                yield _stream_frame(event, fmt)
+        except Exception as e:
+            # The 200 status is already sent; tell the client in-band.
+            logger.warning("AI stream failed", extra={"error": str(e)})
+            yield _stream_frame({"type": "error", "detail": "AI service unavailable or error."}, fmt)
+    # X-Accel-Buffering stops nginx from holding chunks back.
+    return StreamingResponse(body(), media_type=STREAM_MEDIA_TYPES[fmt],
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/ai_suggest", dependencies=AI_ADMISSION)
+async def ai_suggest(
+    prompt: str = Body(..., embed=True),
+    stream: Optional[Literal["sse", "ndjson"]] = Query(None, description="Stream the answer as it is generated"),
+):
+    if stream:
+        async def events():
+            async for text in crud.stream_gemini_api(prompt, cache_ttl=AI_SUGGEST_CACHE_TTL):
+                yield {"type": "delta", "text": text}
+            yield {"type": "done"}
+        return await _stream_response(events(), stream)
+    response = await crud.call_gemini_api(prompt, cache_ttl=AI_SUGGEST_CACHE_TTL)
+    if not response:
+        raise HTTPException(status_code=500, detail="AI service unavailable or error.")
+    return {"suggestion": response}
+
+
+def _conversation_prompt(user_input: str) -> str:
+    return f"""
     User said: \"{user_input}\"
     
     Based on this request, suggest 3-5 specific dishes that would be perfect for the user.
@@ -302,54 +289,153 @@ def ai_conversation(user_input: str = Body(..., embed=True), db: Session = Depen
     
     And so on...
     """
-    response = crud.call_gemini_api(prompt)
+
+async def _direct_dish_suggestion(db: AsyncSession, dish_name: str) -> dict:
+    # Try DB first
+    db_recipe = await crud.get_recipe_by_title(db, dish_name)
+    if db_recipe and db_recipe.ingredients and db_recipe.steps:
+        return {
+            "name": db_recipe.title,
+            "description": db_recipe.description if hasattr(db_recipe, 'description') else '',
+            "ingredients": ', '.join(crud.recipe_ingredients(db_recipe)),
+            "time": db_recipe.estimated_time or '',
+            "difficulty": db_recipe.difficulty or '',
+            "instructions": '\n'.join(crud.recipe_steps(db_recipe)),
+            "reference": getattr(db_recipe, 'reference', ''),
+        }
+    # Call Gemini for this dish, sharing the call with concurrent ai_ingredients requests
+    recipe = await recipe_flights.do(crud.normalize_title(dish_name), _generate_recipe, dish_name)
+    ingredients, steps, reference = recipe["ingredients"], recipe["steps"], recipe["reference"]
+    return {
+        "name": dish_name,
+        "description": f"Recipe for {dish_name}",
+        "ingredients": ', '.join(ingredients),
+        "time": '',
+        "difficulty": '',
+        "instructions": '\n'.join(steps),
+        "reference": reference,
+    }
+
+@router.post("/ai_conversation", dependencies=AI_ADMISSION)
+async def ai_conversation(
+    user_input: str = Body(..., embed=True),
+    stream: Optional[Literal["sse", "ndjson"]] = Query(None, description="Stream tokens and each dish as it completes"),
+    db: AsyncSession = Depends(get_db),
+):
+    logger.debug("ai_conversation", extra={"user_input": user_input})
+
+    # Try to detect if the user is asking for a specific dish
+    dish_name = recipe_parser.extract_requested_dish(user_input)
+
+    if dish_name:
+        # Only return the specific dish as the suggestion
+        # Call the AI for details about this dish (reuse ai_ingredients logic)
+        suggestion = await _direct_dish_suggestion(db, dish_name)
+        if stream:
+            async def direct_events():
+                yield {"type": "dish", "dish": suggestion}
+                yield {"type": "done", "user_input": user_input, "suggestions": [suggestion]}
+            return await _stream_response(direct_events(), stream)
+        return {
+            "user_input": user_input,
+            "suggestions": [suggestion],
+            "ai_response": f"Direct dish request for: {dish_name}"
+        }
+
+    # Otherwise, use the normal AI multi-suggestion logic
+    prompt = _conversation_prompt(user_input)
+    if stream:
+        async def events():
+            parser = recipe_parser.DishStreamParser()
+            dishes = []
+            async for text in crud.stream_gemini_api(prompt, cache_ttl=AI_CONVERSATION_CACHE_TTL):
+                yield {"type": "delta", "text": text}
+                for dish in parser.feed(text):
+                    dishes.append(dish)
+                    yield {"type": "dish", "dish": dish}
+            for dish in parser.close():
+                dishes.append(dish)
+                yield {"type": "dish", "dish": dish}
+            yield {"type": "done", "user_input": user_input, "suggestions": dishes}
+        return await _stream_response(events(), stream)
+    response = await crud.call_gemini_api(prompt, cache_ttl=AI_CONVERSATION_CACHE_TTL)
     if not response:
         raise HTTPException(status_code=500, detail="AI service unavailable or error.")
     # Parse the response into structured data
-    dishes = []
-    current_dish = {}
-    for line in response.split('\n'):
-        line = line.strip()
-        if line.startswith('DISH') and line[4].isdigit():
-            if current_dish:
-                dishes.append(current_dish)
-            current_dish = {}
-        elif line.startswith('Name:'):
-            current_dish['name'] = line.split(':', 1)[1].strip()
-        elif line.startswith('Description:'):
-            current_dish['description'] = line.split(':', 1)[1].strip()
-        elif line.startswith('Ingredients:'):
-            current_dish['ingredients'] = line.split(':', 1)[1].strip()
-        elif line.startswith('Time:'):
-            current_dish['time'] = line.split(':', 1)[1].strip()
-        elif line.startswith('Difficulty:'):
-            current_dish['difficulty'] = line.split(':', 1)[1].strip()
-        elif line.startswith('Instructions:'):
-            current_dish['instructions'] = line.split(':', 1)[1].strip()
-    if current_dish:
-        dishes.append(current_dish)
+    dishes = recipe_parser.parse_dishes(response)
     return {
         "user_input": user_input,
         "suggestions": dishes,
         "ai_response": response
     }
 
+@router.post("/pantry_search", response_model=List[schemas.PantryMatchOut])
+async def pantry_search(search: schemas.PantrySearchRequest, db: AsyncSession = Depends(get_db)):
+    """Recipes ranked by how much of their ingredient list the given pantry covers."""
+    if not pantry_index.index.ready:
+        raise HTTPException(status_code=503, detail="Ingredient index is still loading, try again shortly.")
+    matches = pantry_index.index.search(search.ingredients, limit=search.limit, max_missing=search.max_missing)
+    recipes = await crud.get_recipes_by_ids(db, [match.recipe_id for match in matches])
+    by_id = {recipe.id: recipe for recipe in recipes}
+    results = []
+    for match in matches:
+        recipe = by_id.get(match.recipe_id)
+        if recipe is None:
+            continue
+        lines = crud.recipe_ingredients(recipe)
+        results.append({
+            "recipe": recipe,
+            "matched": match.matched,
+            "missing": match.missing,
+            "coverage": round(match.coverage, 3),
+            "missing_ingredients": [lines[i] for i in match.missing_positions if i < len(lines)],
+        })
+    return results
+
 # THEN the dynamic path routes
 @router.post("/", response_model=schemas.RecipeOut)
-def create_recipe(recipe: schemas.RecipeCreate = Body(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return crud.create_recipe(db, recipe, user_id=current_user.id)
+async def create_recipe(recipe: schemas.RecipeCreate = Body(...), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return await crud.create_recipe(db, recipe, user_id=current_user.id)
 
 @router.get("/", response_model=List[schemas.RecipeOut])
-def list_recipes(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return crud.get_recipes(db, skip=skip, limit=limit)
+async def list_recipes(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_db)):
+    return await crud.get_recipes(db, skip=skip, limit=limit)
+
+@router.get("/page", response_model=schemas.RecipePage)
+async def list_recipes_page(
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    sort: str = Query("id", description="id, title or estimated_time"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Cursor-paginated recipe listing; each page costs the same however deep it is."""
+    try:
+        items, next_cursor = await crud.get_recipes_page(db, limit=limit, cursor=cursor, sort=sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/recommendations", response_model=List[schemas.RecipeOut])
+async def get_recommendations(
+    limit: int = Query(10, ge=1, le=crud.MAX_RECOMMENDATIONS),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Recipes matching the current user's preferences, best matches first."""
+    return await crud.get_recommendations(db, current_user, limit=limit)
+
+@router.get("/feed", response_model=List[schemas.RecipeOut])
+async def get_personalized_feed(
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Recipes liked by users with similar taste to the current user."""
+    return await crud.get_personalized_feed(db, current_user, limit=limit)
 
 @router.get("/{recipe_id}", response_model=schemas.RecipeOut)
-def get_recipe(recipe_id: UUID, db: Session = Depends(get_db)):
-    db_recipe = crud.get_recipe(db, recipe_id)
+async def get_recipe(recipe_id: UUID, db: AsyncSession = Depends(get_db)):
+    db_recipe = await crud.get_recipe(db, recipe_id)
     if not db_recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
     return db_recipe
-
-@router.get("/recommendations", response_model=List[schemas.RecipeOut])
-def get_recommendations(user_id: UUID, db: Session = Depends(get_db)):
-    return crud.get_recommendations(db, user_id=user_id)
\ No newline at end of file
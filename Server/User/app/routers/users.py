@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body, Header
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Header, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from uuid import UUID
+from uuid import UUID, uuid4
 import os
 from dotenv import load_dotenv
 from fastapi.responses import JSONResponse
@@ -10,8 +10,10 @@ from pydantic import BaseModel
 from typing import Optional
 from sqlalchemy.exc import IntegrityError
 
-from .. import models, schemas, crud
-from ..database import SessionLocal
+from .. import models, schemas, crud, passwords, write_behind
+from ..user_cache import user_cache
+from ..revocation import revocations
+from ..database import AsyncSessionLocal
 
 load_dotenv()
 
@@ -21,50 +23,75 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 router = APIRouter(prefix="/api/lutome", tags=["users"])
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(authorization: str = Header(...), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def get_token_payload(authorization: str = Header(...)) -> dict:
+    """Decode the bearer token, rejecting invalid, expired and revoked ones."""
     try:
         if not authorization.startswith("Bearer "):
             raise credentials_exception
         token = authorization.replace("Bearer ", "")
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+        if payload.get("sub") is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = crud.get_user_by_id(db, user_id)
+    jti = payload.get("jti")
+    if jti and revocations.is_revoked(jti):
+        raise credentials_exception
+    return payload
+
+def get_optional_token_payload(authorization: Optional[str] = Header(None)) -> Optional[dict]:
+    """The bearer token's payload, or None for anonymous requests and invalid tokens."""
+    if not authorization:
+        return None
+    try:
+        return get_token_payload(authorization)
+    except HTTPException:
+        return None
+
+async def get_current_user(payload: dict = Depends(get_token_payload), db: AsyncSession = Depends(get_db)):
+    try:
+        user_id = UUID(payload["sub"])
+    except ValueError:
+        raise credentials_exception
+    # Tokens issued before iat was added share the 0 slot.
+    iat = payload.get("iat", 0)
+    user = user_cache.get(user_id, iat)
+    if user is not None:
+        return user
+    user = await crud.get_user_by_id(db, user_id)
     if user is None:
         raise credentials_exception
+    user_cache.set(user, iat)
     return user
 
 @router.post("/register", response_model=schemas.UserOut)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_email = crud.get_user_by_email(db, user.email)
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    db_email = await crud.get_user_by_email(db, user.email)
     if db_email:
         raise HTTPException(status_code=400, detail="Email already registered")
+    hashed_password = await passwords.hash_password(user.password)
     try:
-        return crud.create_user(db, user)
+        return await crud.create_user(db, user, hashed_password)
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         # Check if it's a unique constraint violation for email
         if 'users_email_key' in str(e.orig):
             raise HTTPException(status_code=400, detail="Email already registered")
@@ -82,15 +109,18 @@ class LoginRequest(BaseModel):
     password: str
 
 @router.post("/login", response_model=TokenResponse, summary="Login with email and password")
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, login_data.email, login_data.password)
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
+    user = await crud.authenticate_user(db, login_data.email, login_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     access_token = create_access_token(data={"sub": str(user.id)})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@router.post("/logout", response_model=LogoutResponse, summary="Logout (client should delete token)")
-def logout():
+@router.post("/logout", response_model=LogoutResponse, summary="Logout (revokes the token)")
+async def logout(payload: dict = Depends(get_token_payload), db: AsyncSession = Depends(get_db)):
+    # Tokens issued before jti was added can't be revoked; they simply expire.
+    if payload.get("jti"):
+        await revocations.revoke(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]), user_id=UUID(payload["sub"]))
     return {"message": "Successfully logged out. Please delete your token on the client."}
 
 @router.get("/me", response_model=schemas.UserOut)
@@ -98,66 +128,58 @@ def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 @router.patch("/update", response_model=schemas.UserOut)
-def update_user(update: schemas.UserCreate = Body(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    user = crud.update_user(db, current_user.id, update)
+async def update_user(update: schemas.UserCreate = Body(...), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    hashed_password = await passwords.hash_password(update.password) if update.password else None
+    user = await crud.update_user(db, current_user.id, update, hashed_password)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @router.post("/voice-query")
-def save_voice_query(query: schemas.VoiceQueryCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    voice_query = models.VoiceQuery(
+async def save_voice_query(query: schemas.VoiceQueryCreate, current_user: models.User = Depends(get_current_user)):
+    # Buffered and inserted in batches; it shows up in voice-history within WRITE_BEHIND_FLUSH_SECONDS.
+    write_behind.voice_queries.add(
         user_id=current_user.id,
         query_text=query.query_text,
         created_at=datetime.utcnow()
     )
-    db.add(voice_query)
-    db.commit()
-    db.refresh(voice_query)
     return {"success": True, "message": "Voice query saved"}
 
-@router.get("/voice-history")
-def get_voice_history(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    queries = db.query(models.VoiceQuery).filter(
-        models.VoiceQuery.user_id == current_user.id
-    ).order_by(models.VoiceQuery.created_at.desc()).limit(20).all()
-    
+def _history_item(row) -> dict:
     return {
-        "queries": [
-            {
-                "id": query.id,
-                "query_text": query.query_text,
-                "created_at": query.created_at.isoformat() if query.created_at else None
-            }
-            for query in queries
-        ]
+        "id": row.id,
+        "query_text": row.query_text,
+        "created_at": row.created_at.isoformat() if row.created_at else None
     }
 
+@router.get("/voice-history")
+async def get_voice_history(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    try:
+        queries, next_cursor = await crud.get_history_page(db, models.VoiceQuery, current_user.id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"queries": [_history_item(query) for query in queries], "next_cursor": next_cursor}
+
 @router.post("/search-history")
-def save_search_history(search: str = Body(..., embed=True), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    # Save search to voice queries for now (can create separate table later)
-    voice_query = models.VoiceQuery(
-        user_id=current_user.id,
-        query_text=search,
-        created_at=datetime.utcnow()
-    )
-    db.add(voice_query)
-    db.commit()
+async def save_search_history(search: str = Body(..., embed=True), current_user: models.User = Depends(get_current_user)):
+    # Buffered like voice queries; a repeat of the user's previous search is not stored again.
+    crud.record_search(current_user.id, search)
     return {"success": True, "message": "Search history saved"}
 
 @router.get("/search-history")
-def get_search_history(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    queries = db.query(models.VoiceQuery).filter(
-        models.VoiceQuery.user_id == current_user.id
-    ).order_by(models.VoiceQuery.created_at.desc()).limit(50).all()
-    
-    return {
-        "history": [
-            {
-                "id": query.id,
-                "query_text": query.query_text,
-                "created_at": query.created_at.isoformat() if query.created_at else None
-            }
-            for query in queries
-        ]
-    } 
\ No newline at end of file
+async def get_search_history(
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    try:
+        searches, next_cursor = await crud.get_history_page(db, models.SearchHistory, current_user.id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"history": [_history_item(search) for search in searches], "next_cursor": next_cursor}
@@ -19,6 +19,12 @@ class UserOut(UserBase):
     class Config:
         orm_mode = True
 
+class IngredientItem(BaseModel):
+    text: str
+    name: str
+    quantity: Optional[str] = None
+    unit: Optional[str] = None
+
 class RecipeBase(BaseModel):
     title: str
     image_url: Optional[str] = None
@@ -34,10 +40,28 @@ class RecipeCreate(RecipeBase):
 class RecipeOut(RecipeBase):
     id: UUID
     created_by: Optional[UUID] = None
+    ingredient_items: Optional[List[IngredientItem]] = None
+    step_items: Optional[List[str]] = None
 
     class Config:
         orm_mode = True
 
+class RecipePage(BaseModel):
+    items: List[RecipeOut]
+    next_cursor: Optional[str] = None
+
+class PantrySearchRequest(BaseModel):
+    ingredients: List[str] = Field(..., min_length=1, max_length=100)
+    limit: int = Field(20, ge=1, le=100)
+    max_missing: Optional[int] = Field(None, ge=0)
+
+class PantryMatchOut(BaseModel):
+    recipe: RecipeOut
+    matched: int
+    missing: int
+    coverage: float
+    missing_ingredients: List[str]
+
 class UserRecipeInteractionBase(BaseModel):
     liked: Optional[bool] = False
 
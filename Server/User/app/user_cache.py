@@ -0,0 +1,148 @@
+"""Cache of the user records get_current_user needs, so authenticated
+requests don't each cost a Postgres lookup.
+
+Entries are grouped per user and keyed inside that group by the token's
+``iat``, so update_user can drop every cached copy of a user at once. By
+default the cache lives in process memory; set USER_CACHE_REDIS_URL to
+share it (and its invalidations) between workers through Redis or any
+Redis-compatible server.
+"""
+import json
+import logging
+import os
+import time
+from typing import Optional
+from uuid import UUID
+
+from dotenv import load_dotenv
+
+from . import models
+from .cache import LRUCache
+
+try:
+    import redis
+except ImportError:  # optional, only needed for USER_CACHE_REDIS_URL
+    redis = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_USERS = int(os.getenv("USER_CACHE_MAX_USERS", "10000"))
+USER_CACHE_REDIS_URL = os.getenv("USER_CACHE_REDIS_URL")
+
+# Columns copied into the cache; the password hash is deliberately left out.
+USER_FIELDS = ("id", "first_name", "last_name", "email", "role", "status", "preferences")
+
+
+def to_record(user: models.User) -> dict:
+    record = {field: getattr(user, field) for field in USER_FIELDS}
+    record["id"] = str(user.id)
+    return record
+
+
+def from_record(record: dict) -> models.User:
+    """Build a detached User from a cached record (only USER_FIELDS are set)."""
+    return models.User(**{**record, "id": UUID(record["id"])})
+
+
+class MemoryUserCache:
+    """Per-process backend: user id -> {iat: record}, LRU-bounded by user."""
+
+    def __init__(self, max_users: int, ttl: float):
+        self.ttl = ttl
+        self._users = LRUCache(maxsize=max_users, ttl=ttl)
+
+    def get(self, user_id: str, iat: int) -> Optional[dict]:
+        entries = self._users.get(user_id)
+        if entries is None:
+            return None
+        entry = entries.get(iat)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    def set(self, user_id: str, iat: int, record: dict):
+        entries = self._users.get(user_id) or {}
+        entries = {**entries, iat: (time.time() + self.ttl, record)}
+        self._users.set(user_id, entries)
+
+    def invalidate(self, user_id: str):
+        self._users.delete(user_id)
+
+
+class RedisUserCache:
+    """Shared backend: one Redis hash per user (``user:<id>``), one field per iat."""
+
+    def __init__(self, url: str, ttl: float):
+        if redis is None:
+            raise RuntimeError("USER_CACHE_REDIS_URL is set but the redis package is not installed")
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"user:{user_id}"
+
+    def get(self, user_id: str, iat: int) -> Optional[dict]:
+        raw = self._client.hget(self._key(user_id), str(iat))
+        if raw is None:
+            return None
+        expires_at, record = json.loads(raw)
+        # The hash expires as a whole, so older fields carry their own deadline.
+        if expires_at <= time.time():
+            return None
+        return record
+
+    def set(self, user_id: str, iat: int, record: dict):
+        key = self._key(user_id)
+        pipe = self._client.pipeline()
+        pipe.hset(key, str(iat), json.dumps([time.time() + self.ttl, record]))
+        pipe.expire(key, int(self.ttl) + 1)
+        pipe.execute()
+
+    def invalidate(self, user_id: str):
+        self._client.delete(self._key(user_id))
+
+
+class UserCache:
+    """Front for the configured backend. Backend errors count as misses."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, iat: int) -> Optional[models.User]:
+        try:
+            record = self.backend.get(str(user_id), iat)
+        except Exception as e:
+            logger.warning("User cache lookup failed", extra={"error": str(e)})
+            record = None
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return from_record(record)
+
+    def set(self, user: models.User, iat: int):
+        try:
+            self.backend.set(str(user.id), iat, to_record(user))
+        except Exception as e:
+            logger.warning("User cache store failed", extra={"error": str(e)})
+
+    def invalidate(self, user_id):
+        try:
+            self.backend.invalidate(str(user_id))
+        except Exception as e:
+            logger.warning("User cache invalidate failed", extra={"error": str(e)})
+
+
+def _make_backend():
+    if USER_CACHE_REDIS_URL:
+        return RedisUserCache(USER_CACHE_REDIS_URL, USER_CACHE_TTL)
+    return MemoryUserCache(USER_CACHE_MAX_USERS, USER_CACHE_TTL)
+
+
+user_cache = UserCache(_make_backend())
@@ -0,0 +1,140 @@
+"""Buffered, batched inserts for high-volume fire-and-forget rows.
+
+Endpoints hand rows to a BatchWriter and return at once. A background task
+writes the buffer as one batched INSERT whenever WRITE_BEHIND_BATCH_SIZE
+rows are waiting or WRITE_BEHIND_FLUSH_SECONDS have passed, and once more on
+shutdown. Rows sit in memory until then, so a crashed worker loses at most
+one interval's worth, and reads may lag writes by up to one interval.
+
+Batches that fail on a connection problem are put back and retried on the
+next flush. Batches the database rejects are split in halves until the
+offending rows are isolated; those are dropped, logged and counted, so one
+bad row can't hold up everything buffered behind it.
+"""
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import exc, insert
+
+from . import models
+from .database import AsyncSessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "1"))
+# Rows kept while the database is unreachable; the oldest are dropped beyond this.
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "50000"))
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether the insert may succeed if retried later (lost connection, pool timeout, ...)."""
+    if isinstance(error, exc.DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (exc.OperationalError, exc.InterfaceError, exc.TimeoutError,
+                              OSError, asyncio.TimeoutError))
+
+
+class BatchWriter:
+    def __init__(self, model, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_seconds: float = WRITE_BEHIND_FLUSH_SECONDS, max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flushes = 0
+        self._rows: List[dict] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, **row):
+        self._rows.append(row)
+        if len(self._rows) > self.max_pending:
+            overflow = len(self._rows) - self.max_pending
+            del self._rows[:overflow]
+            self.dropped += overflow
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Write the rows buffered so far; rows are put back if the database is unreachable."""
+        # Rows added while this runs wait for the next flush instead of
+        # turning a trickle of requests into a stream of tiny inserts.
+        pending, self._rows = self._rows, []
+        retry: List[dict] = []
+        for start in range(0, len(pending), self.batch_size):
+            await self._write(pending[start:start + self.batch_size], retry)
+        if retry:
+            self._rows[:0] = retry
+
+    async def _write(self, rows: List[dict], retry: List[dict]):
+        """Insert ``rows``, bisecting around rows the database rejects.
+
+        After a transient failure this and later batches are appended to
+        ``retry`` untried.
+        """
+        if retry:
+            retry.extend(rows)
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(self.model), rows)
+                await db.commit()
+        except Exception as e:
+            if _is_transient(e):
+                retry.extend(rows)
+                logger.warning("Write-behind flush failed", extra={
+                    "table": self.model.__tablename__, "rows": len(rows), "error": str(e)})
+                return
+            if len(rows) == 1:
+                self.rejected += 1
+                logger.warning("Write-behind row rejected", extra={
+                    "table": self.model.__tablename__, "row": rows[0], "error": str(e)})
+                return
+            middle = len(rows) // 2
+            await self._write(rows[:middle], retry)
+            await self._write(rows[middle:], retry)
+            return
+        self.written += len(rows)
+        self.flushes += 1
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and write whatever is still buffered."""
+        if self._task is not None:
+            # Let an in-progress flush finish rather than cancelling it mid-insert.
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+voice_queries = BatchWriter(models.VoiceQuery)
+search_history = BatchWriter(models.SearchHistory)
+writers = (voice_queries, search_history)
@@ -0,0 +1,43 @@
+"""Fill recipes.ingredient_items / step_items for rows created before those columns existed.
+
+Safe to re-run: only rows whose ingredient_items is still NULL are touched,
+in batches so the table is never locked for long.
+
+    python backfill_recipe_items.py [--batch-size 500]
+"""
+import argparse
+
+from app import crud, models
+from app.database import SessionLocal
+
+
+def backfill(batch_size: int) -> int:
+    db = SessionLocal()
+    updated = 0
+    last_id = None
+    try:
+        while True:
+            query = db.query(models.Recipe).filter(models.Recipe.ingredient_items.is_(None))
+            if last_id is not None:
+                query = query.filter(models.Recipe.id > last_id)
+            batch = query.order_by(models.Recipe.id).limit(batch_size).all()
+            if not batch:
+                break
+            for recipe in batch:
+                recipe.ingredient_items = crud.ingredient_items(crud.recipe_ingredients(recipe))
+                recipe.step_items = crud.recipe_steps(recipe)
+            db.commit()
+            updated += len(batch)
+            last_id = batch[-1].id
+            print(f"Backfilled {updated} recipes")
+    finally:
+        db.close()
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill structured recipe ingredients and steps.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    total = backfill(args.batch_size)
+    print(f"Done, {total} recipes updated.")
@@ -0,0 +1,107 @@
+"""Micro-benchmark for app.recipe_parser over sample Gemini responses.
+
+Run from Server/User:
+
+    python benchmarks/bench_recipe_parser.py [--number 2000]
+
+Prints the mean time per parse for each response format, next to the
+inline parser the routers used before app.recipe_parser existed.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import recipe_parser  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_responses.json")
+
+
+def legacy_parse_recipe(response):
+    """The parser previously copy-pasted into ai_ingredients and ai_conversation."""
+    ingredients, steps, reference = [], [], ""
+    section = None
+    for line in response.split('\n'):
+        line = line.strip()
+        if re.match(r"^\*?\*?ingredients\*?\*?:?", line.lower()):
+            section = "ingredients"
+            continue
+        if re.match(r"^\*?\*?steps\*?\*?:?", line.lower()):
+            section = "steps"
+            continue
+        if re.match(r"^\*?\*?reference\*?\*?:?", line.lower()):
+            section = "reference"
+            allowed_domains = ["youtube.com", "allrecipes.com", "foodnetwork.com", "tasty.co", "epicurious.com", "panlasangpinoy.com", "yummly.com", "simplyrecipes.com", "bbcgoodfood.com", "tasteofhome.com"]
+            urls = re.findall(r"https?://\S+", line)
+            found = False
+            for url in urls:
+                for domain in allowed_domains:
+                    if domain in url:
+                        reference = url
+                        found = True
+                        break
+                if found:
+                    break
+            if not found:
+                if urls:
+                    reference = urls[0]
+                else:
+                    reference = line.split(":", 1)[-1].strip()
+            continue
+        elif section == "reference" and line.strip():
+            urls = re.findall(r"https?://\S+", line)
+            found = False
+            for url in urls:
+                for domain in allowed_domains:
+                    if domain in url:
+                        reference = url
+                        found = True
+                        break
+                if found:
+                    break
+            if not found and not reference:
+                if urls:
+                    reference = urls[0]
+                else:
+                    reference = line.strip()
+        if section == "ingredients" and (line.startswith("-") or line.startswith("*") or line[:1].isdigit()):
+            name = re.sub(r"^[\-*\d.\s]+", "", line)
+            if name:
+                ingredients.append(name)
+        elif section == "steps" and (line[:1].isdigit() or line.startswith("-") or line.startswith("*")):
+            step = re.sub(r"^[\-*\d.\s]+", "", line)
+            if step:
+                steps.append(step)
+    return ingredients, steps, reference
+
+
+def bench(label, fn, responses, number):
+    seconds = timeit.timeit(lambda: [fn(r) for r in responses], number=number)
+    per_parse_us = seconds / (number * len(responses)) * 1e6
+    print(f"{label:<32} {per_parse_us:8.2f} us/parse")
+    return per_parse_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000, help="iterations over the corpus")
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH) as f:
+        corpus = json.load(f)
+
+    print(f"{len(corpus['recipe'])} recipe, {len(corpus['dishes'])} multi-dish and "
+          f"{len(corpus['dish_list'])} dish-list responses, {args.number} iterations\n")
+    legacy = bench("recipe (legacy inline parser)", legacy_parse_recipe, corpus["recipe"], args.number)
+    current = bench("recipe (parse_recipe)", recipe_parser.parse_recipe, corpus["recipe"], args.number)
+    print(f"{'':<32} {legacy / current:8.2f}x faster\n")
+    bench("multi-dish (parse_dishes)", recipe_parser.parse_dishes, corpus["dishes"], args.number)
+    bench("dish list (parse_dish_names)", recipe_parser.parse_dish_names, corpus["dish_list"], args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Recompute the "similar users liked" neighbours used by /recipes/feed.
+
+Run periodically (e.g. nightly from cron):
+
+    python build_recipe_neighbors.py [--neighbors 20]
+"""
+import argparse
+
+from app import logs, similarity
+from app.database import SessionLocal
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the recipe_neighbors table.")
+    parser.add_argument("--neighbors", type=int, default=similarity.DEFAULT_NEIGHBORS,
+                        help="neighbours kept per recipe")
+    args = parser.parse_args()
+    logs.setup()
+    db = SessionLocal()
+    try:
+        similarity.rebuild(db, k=args.neighbors)
+    finally:
+        db.close()
+        logs.shutdown()
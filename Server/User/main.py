@@ -1,10 +1,92 @@
+import asyncio
+import logging
 import subprocess
 import sys
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from app import gemini, cache, pantry_index, passwords, revocation, write_behind, crud, models, metrics, logs, images, resilience, ratelimit
+from app.database import SessionLocal, AsyncSessionLocal, async_engine, engine, pool_stats
 from app.routers import users, recipes
 
-app = FastAPI()
+logs.setup()
+logger = logging.getLogger(__name__)
+
+def build_pantry_index():
+    db = SessionLocal()
+    try:
+        pantry_index.index.build(db)
+    except Exception:
+        logger.exception("Pantry index build failed")
+    finally:
+        db.close()
+
+async def refresh_pantry_index():
+    while True:
+        await asyncio.sleep(pantry_index.PANTRY_INDEX_REFRESH_SECONDS)
+        await pantry_index.run_refresh()
+
+async def refresh_revocations():
+    while True:
+        await asyncio.sleep(revocation.REVOCATION_REFRESH_SECONDS)
+        await revocation.run_refresh()
+
+HISTORY_PRUNE_INTERVAL_SECONDS = 6 * 3600
+
+async def prune_history():
+    while True:
+        for model in (models.VoiceQuery, models.SearchHistory):
+            try:
+                async with AsyncSessionLocal() as db:
+                    deleted = await crud.prune_history(db, model)
+                if deleted:
+                    logger.info("Pruned history", extra={"table": model.__tablename__, "rows": deleted})
+            except Exception:
+                logger.exception("Pruning history failed", extra={"table": model.__tablename__})
+        await asyncio.sleep(HISTORY_PRUNE_INTERVAL_SECONDS)
+
+async def queue_missing_images():
+    try:
+        await images.enqueue_missing()
+    except Exception:
+        logger.exception("Queueing recipes without images failed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build in the background so startup isn't blocked on large catalogs;
+    # /recipes/pantry_search answers 503 until it is ready.
+    index_task = asyncio.create_task(run_in_threadpool(build_pantry_index))
+    index_refresh_task = asyncio.create_task(refresh_pantry_index())
+    passwords.start()
+    # Load revocations before serving so revoked tokens are never accepted.
+    await revocation.run_refresh()
+    revocation_task = asyncio.create_task(refresh_revocations())
+    for writer in write_behind.writers:
+        writer.start()
+    prune_task = asyncio.create_task(prune_history()) if crud.HISTORY_RETENTION_DAYS > 0 else None
+    images.start()
+    recipes.recipe_prefetcher.start()
+    queue_images_task = asyncio.create_task(queue_missing_images())
+    yield
+    if prune_task:
+        prune_task.cancel()
+    for writer in write_behind.writers:
+        await writer.stop()
+    queue_images_task.cancel()
+    index_task.cancel()
+    index_refresh_task.cancel()
+    revocation_task.cancel()
+    passwords.shutdown()
+    await images.stop()
+    await recipes.recipe_prefetcher.stop()
+    await gemini.close_client()
+    cache.close_prompt_cache()
+    await async_engine.dispose()
+    engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,6 +95,35 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(resilience.DeadlineMiddleware)
+# Outside CORS and the deadline so it times the whole request; only the request id wraps it.
+app.add_middleware(metrics.MetricsMiddleware)
+# Outside the metrics middleware so the slow-request profiler's log line gets the id.
+app.add_middleware(logs.RequestIdMiddleware)
+
+@app.exception_handler(passwords.HasherBusy)
+async def hasher_busy_handler(request: Request, exc: passwords.HasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many login requests, please try again shortly"},
+        headers={"Retry-After": str(passwords.PASSWORD_HASH_RETRY_AFTER)},
+    )
+
+@app.exception_handler(resilience.UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: resilience.UpstreamUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "AI service is temporarily unavailable, please try again shortly"},
+        headers={"Retry-After": resilience.retry_after_header(exc.retry_after)},
+    )
+
+@app.exception_handler(ratelimit.RateLimited)
+async def rate_limited_handler(request: Request, exc: ratelimit.RateLimited):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.detail},
+        headers={"Retry-After": resilience.retry_after_header(exc.retry_after)},
+    )
 
 app.include_router(users.router)
 app.include_router(recipes.router)
@@ -21,11 +132,22 @@ app.include_router(recipes.router)
 def read_root():
     return {"message": "Welcome to LutoMate API!"}
 
+@app.get("/db/pool")
+def db_pool():
+    """Connection pool usage and checkout wait times for this worker."""
+    return pool_stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Request, SQL, upstream, cache and pool metrics for this worker, in Prometheus format."""
+    content, content_type = metrics.render()
+    return Response(content, media_type=content_type)
+
 if __name__ == "__main__":
     # Auto-run Alembic migrations
     try:
         subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], check=True)
     except Exception as e:
-        print(f"Alembic migration failed: {e}")
+        logger.error("Alembic migration failed", extra={"error": str(e)})
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file